@@ -1,23 +1,23 @@
-import csv
+import numpy as np
 from logger import log_message
 
 def load_data(filepath):
     """Load numeric data from a CSV file."""
     log_message(f"Loading data from {filepath}")
-    with open(filepath, newline='') as csvfile:
-        reader = csv.reader(csvfile)
-        data = []
-        for row in reader:
-            try:
-                val = float(row[0])
-                data.append(val)
-            except (ValueError, IndexError):
-                log_message(f"Skipping invalid row: {row}")
+    try:
+        data = np.loadtxt(filepath, delimiter=',', usecols=0, dtype=np.float64, ndmin=1)
+    except ValueError:
+        # Some rows are not numeric: parse tolerantly (bad values become NaN) and drop them
+        data = np.genfromtxt(filepath, delimiter=',', usecols=0, dtype=np.float64,
+                             invalid_raise=False, ndmin=1)
+        valid = ~np.isnan(data)
+        log_message(f"Skipped {data.size - int(valid.sum())} invalid rows.")
+        data = data[valid]
     return data
 
 def preprocess_data(data):
     """Clean data by removing negative values."""
     log_message("Preprocessing data (remove negatives)...")
-    cleaned = [x for x in data if x >= 0]
-    log_message(f"Cleaned {len(data) - len(cleaned)} invalid entries.")
+    cleaned = data[data >= 0]
+    log_message(f"Cleaned {data.size - cleaned.size} invalid entries.")
     return cleaned
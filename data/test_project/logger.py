@@ -1,6 +1,30 @@
-import datetime
+import sys
+import time
 
-def log_message(msg):
+DEBUG = 10
+INFO = 20
+
+_LEVEL = INFO
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_last_second = None
+_last_stamp = ""
+
+# Batch writes when stdout is not a terminal (PYTHONUNBUFFERED would otherwise
+# turn every print into its own write() call); buffered output is flushed at exit.
+if not sys.stdout.isatty() and hasattr(sys.stdout, "reconfigure"):
+    sys.stdout.reconfigure(line_buffering=False, write_through=False)
+
+def _timestamp():
+    """Return the formatted local time, re-formatting at most once per second."""
+    global _last_second, _last_stamp
+    now = int(time.time())
+    if now != _last_second:
+        _last_second = now
+        _last_stamp = time.strftime(_TIME_FORMAT, time.localtime(now))
+    return _last_stamp
+
+def log_message(msg, level=INFO):
     """Print a timestamped log message."""
-    time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{time}] {msg}")
+    if level < _LEVEL:
+        return
+    print(f"[{_timestamp()}] {msg}")
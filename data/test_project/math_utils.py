@@ -1,16 +1,17 @@
+import numpy as np
 from logger import log_message
 
 def compute_average(values):
     """Compute the average of a list of numbers."""
     log_message("Computing average...")
-    if not values:
+    if len(values) == 0:
         return 0.0
-    return sum(values) / len(values)
+    return float(np.mean(values))
 
 def compute_variance(values):
     """Compute the variance of a list of numbers."""
     log_message("Computing variance...")
-    if not values:
+    if len(values) == 0:
         return 0.0
-    mean = compute_average(values)
-    return sum((x - mean) ** 2 for x in values) / len(values)
+    a = np.asarray(values, dtype=np.float64)
+    return float(a.var())
@@ -1,16 +1,31 @@
-import json
+import orjson
 import argparse
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, List
 
 
 def load_json(p: Path) -> Dict[str, Any]:
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
-def save_text(p: Path, s: str) -> None:
+def write_sections(p: Path, title: str, items: Iterable[Dict[str, Any]]) -> None:
+    """
+    Stream sections to the Markdown file one by one instead of joining the whole document in memory.
+    Layout: title, blank line, then each section followed by a '---' separator line.
+    """
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(s, encoding="utf-8")
+    with p.open("w", encoding="utf-8") as f:
+        f.write(f"# {title}\n")
+        for it in items:
+            sid = it.get("id", "")
+            raw = (it.get("raw") or "").strip()
+
+            f.write("\n")
+            if not raw:
+                f.write(f"### {sid}\n_Missing content._\n")
+            else:
+                f.write(raw)
+            f.write("\n---")  # section separator
 
 
 def main():
@@ -28,22 +43,7 @@ def main():
         return
 
     # Reverse order
-    items = list(reversed(items))
-
-    parts: List[str] = [f"# {args.title}", ""]
-    for it in items:
-        sid = it.get("id", "")
-        raw = (it.get("raw") or "").strip()
-
-        if not raw:
-            parts.append(f"### {sid}\n_Missing content._\n")
-        else:
-            parts.append(raw)
-
-        parts.append("---")  # section separator
-
-    result = "\n".join(parts)
-    save_text(Path(args.output), result)
+    write_sections(Path(args.output), args.title, reversed(items))
     print(f"[INFO] Combined {len(items)} sections in reverse order → {args.output}")
 
 
@@ -7,64 +7,107 @@ It switches prompts based on the symbol 'kind' (Class vs Function).
 """
 
 import os
-import json
+import orjson
 import argparse
+import hashlib
+import shelve
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
 import google.generativeai as genai
 
 
 def load_json(p: Path):
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 
 def save_json(obj, p: Path):
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 
 # ---------------- Prompt Templates ----------------
+# Built once at import; the builders only fill in the placeholders with str.format.
+
+# Kinds that should be treated as Class structures
+CLASS_KINDS = {"class", "interface", "struct", "enum", "module"}
+
+CLASS_PROMPT_TEMPLATE = (
+    "You are a technical writer documenting a Python **Class**.\n"
+    "Analyze the following class definition and produce a structured **Markdown** section.\n"
+    "\n"
+    "**Requirements:**\n"
+    "- Output **Markdown only**.\n"
+    "- Focus on the **responsibility** of the class and how it manages state.\n"
+    "- Structure the output as follows:\n"
+    "\n"
+    "### <Class Name>\n"
+    "**ID:** `{sid}`\n"
+    "**Type:** Class\n"
+    "\n"
+    "**Summary**:\n"
+    "  - A concise overview of what this class represents and its primary role.\n"
+    "\n"
+    "**Attributes**:\n"
+    "  - List key instance variables (self.var) or class variables.\n"
+    "  - Explain what each attribute stores.\n"
+    "\n"
+    "**Key Methods**:\n"
+    "  - Briefly summarize the most important methods (public APIs).\n"
+    "  - Group them logically if there are many (e.g., 'Initialization', 'Data Processing').\n"
+    "\n"
+    "**Inheritance**:\n"
+    "  - If it inherits from other classes, mention them and explain the relationship.\n"
+    "\n"
+    "**Usage Context**:\n"
+    "  - Explain when or why a developer would instantiate this class.\n"
+    "\n"
+    "Python code to analyze:\n"
+    "```python\n"
+    "{snippet}\n"
+    "```"
+)
+
+FUNCTION_PROMPT_TEMPLATE = (
+    "You are a technical writer documenting a Python **{kind}**.\n"
+    "Analyze the following code and produce a structured **Markdown** section.\n"
+    "\n"
+    "**Requirements:**\n"
+    "- Output **Markdown only**.\n"
+    "- Focus on the **step-by-step logic**, control flow, and data transformation.\n"
+    "- Structure the output as follows:\n"
+    "\n"
+    "### <Name>\n"
+    "**ID:** `{sid}`\n"
+    "**Type:** {kind}\n"
+    "**Signature:** `<def ... line>`\n"
+    "\n"
+    "**Purpose**:\n"
+    "  - Shortly explain what this function accomplishes.\n"
+    "\n"
+    "**Detailed Logic**:\n"
+    "  - Step-by-step walkthrough of the operation.\n"
+    "  - Explain key decisions (if/else), loops, and algorithm details.\n"
+    "\n"
+    "**Inputs & Outputs**:\n"
+    "  - **Args**: Parameters and their roles.\n"
+    "  - **Returns**: What is returned and its type.\n"
+    "\n"
+    "**Edge Cases**:\n"
+    "  - How does it handle None, empty lists, or exceptions?\n"
+    "\n"
+    "Python code to analyze:\n"
+    "```python\n"
+    "{snippet}\n"
+    "```"
+)
+
 
 def build_class_prompt(item):
     """Build a prompt specifically for Python Classes."""
     snippet = item.get("code_snippet", "")
     sid = item.get("id", "unknown")
-    
-    return (
-        f"You are a technical writer documenting a Python **Class**.\n"
-        f"Analyze the following class definition and produce a structured **Markdown** section.\n"
-        f"\n"
-        f"**Requirements:**\n"
-        f"- Output **Markdown only**.\n"
-        f"- Focus on the **responsibility** of the class and how it manages state.\n"
-        f"- Structure the output as follows:\n"
-        f"\n"
-        f"### <Class Name>\n"
-        f"**ID:** `{sid}`\n"
-        f"**Type:** Class\n"
-        f"\n"
-        f"**Summary**:\n"
-        f"  - A concise overview of what this class represents and its primary role.\n"
-        f"\n"
-        f"**Attributes**:\n"
-        f"  - List key instance variables (self.var) or class variables.\n"
-        f"  - Explain what each attribute stores.\n"
-        f"\n"
-        f"**Key Methods**:\n"
-        f"  - Briefly summarize the most important methods (public APIs).\n"
-        f"  - Group them logically if there are many (e.g., 'Initialization', 'Data Processing').\n"
-        f"\n"
-        f"**Inheritance**:\n"
-        f"  - If it inherits from other classes, mention them and explain the relationship.\n"
-        f"\n"
-        f"**Usage Context**:\n"
-        f"  - Explain when or why a developer would instantiate this class.\n"
-        f"\n"
-        f"Python code to analyze:\n"
-        f"```python\n"
-        f"{snippet}\n"
-        f"```"
-    )
+    return CLASS_PROMPT_TEMPLATE.format(sid=sid, snippet=snippet)
 
 
 def build_function_prompt(item):
@@ -72,61 +115,51 @@ def build_function_prompt(item):
     snippet = item.get("code_snippet", "")
     sid = item.get("id", "unknown")
     kind = item.get("kind", "Function")
-
-    return (
-        f"You are a technical writer documenting a Python **{kind}**.\n"
-        f"Analyze the following code and produce a structured **Markdown** section.\n"
-        f"\n"
-        f"**Requirements:**\n"
-        f"- Output **Markdown only**.\n"
-        f"- Focus on the **step-by-step logic**, control flow, and data transformation.\n"
-        f"- Structure the output as follows:\n"
-        f"\n"
-        f"### <Name>\n"
-        f"**ID:** `{sid}`\n"
-        f"**Type:** {kind}\n"
-        f"**Signature:** `<def ... line>`\n"
-        f"\n"
-        f"**Purpose**:\n"
-        f"  - Shortly explain what this function accomplishes.\n"
-        f"\n"
-        f"**Detailed Logic**:\n"
-        f"  - Step-by-step walkthrough of the operation.\n"
-        f"  - Explain key decisions (if/else), loops, and algorithm details.\n"
-        f"\n"
-        f"**Inputs & Outputs**:\n"
-        f"  - **Args**: Parameters and their roles.\n"
-        f"  - **Returns**: What is returned and its type.\n"
-        f"\n"
-        f"**Edge Cases**:\n"
-        f"  - How does it handle None, empty lists, or exceptions?\n"
-        f"\n"
-        f"Python code to analyze:\n"
-        f"```python\n"
-        f"{snippet}\n"
-        f"```"
-    )
+    return FUNCTION_PROMPT_TEMPLATE.format(sid=sid, snippet=snippet, kind=kind)
 
 
 def get_prompt_by_kind(item):
     """Dispatch based on symbol kind."""
     kind = str(item.get("kind", "")).lower()
     
-    # List of kinds that should be treated as Class structures
-    class_kinds = {"class", "interface", "struct", "enum", "module"}
-    
-    if kind in class_kinds:
+    if kind in CLASS_KINDS:
         return build_class_prompt(item)
     else:
         # Default to function prompt for Method, Function, Constructor, etc.
         return build_function_prompt(item)
 
 
+def prompt_cache_key(model_name, prompt):
+    """Cache key for a generated doc: identical prompts to the same model share one result."""
+    return hashlib.sha256((model_name + "\0" + prompt).encode("utf-8")).hexdigest()
+
+
+def generate_doc(model, sid, prompt):
+    """
+    Call the model for one prompt and return (text, ok).
+    Errors are returned as text so one failure does not stop the run; ok=False keeps them out of the cache.
+    """
+    # Single print call so prompts from concurrent workers do not interleave
+    print(f"{'=' * 20}\n{prompt}\n{'=' * 20}")
+    try:
+        resp = model.generate_content(prompt)
+        return (resp.text or "").strip(), True
+    except Exception as e:
+        print(f"[WARN] Failed to generate for {sid}: {e}")
+        return f"[ERROR calling model: {e}]", False
+
+
 def main():
     ap = argparse.ArgumentParser(description="Test Gemini Writer agent pipeline.")
     ap.add_argument("--input-file", required=True, help="Path to sorted snippets JSON.")
     ap.add_argument("--output-file", required=True, help="Path to save output.")
     ap.add_argument("--model", default="gemini-2.5-flash-lite", help="Model name.")
+    ap.add_argument("--workers", type=int, default=8,
+                    help="Number of concurrent model requests (lower it if you hit rate limits).")
+    ap.add_argument("--cache-file",
+                    help="On-disk cache of generated docs keyed by model+prompt "
+                         "(default: .writer_cache next to the output file).")
+    ap.add_argument("--no-cache", action="store_true", help="Always call the model, ignoring the cache.")
     args = ap.parse_args()
 
     # Load API key
@@ -143,12 +176,12 @@ def main():
     
     # Fallback for old data format where snippets were separate
     snippets_list = data.get("snippets", [])
-    snippets_map = {s.get("id"): s for s in snippets_list if isinstance(s.get("id"), str)}
+    snippets_map = {sid: s for s in snippets_list if isinstance(sid := s.get("id"), str)}
 
-    results = []
-    
     print(f"[INFO] Processing {len(symbols)} symbols...")
 
+    # Collect the work items first, then fan the (network-bound) model calls out to a thread pool
+    items = []
     for sym in symbols:
         sid = sym.get("id")
         
@@ -163,32 +196,47 @@ def main():
             continue
 
         # Prepare item for prompt generation
-        item = {
+        items.append({
             "id": sid, 
+            "file": sym.get("file", ""),
             "kind": sym.get("kind", "Function"), # Default to Function if kind is missing
             "code_snippet": code
-        }
-        
-        # Generate prompt based on Kind
-        prompt = get_prompt_by_kind(item)
-        print('='*20)
-        print(prompt)
-        print('='*20)
-        try:
-            resp = model.generate_content(prompt)
-            text = (resp.text or "").strip()
-        except Exception as e:
-            text = f"[ERROR calling model: {e}]"
-            print(f"[WARN] Failed to generate for {sid}: {e}")
-
-        # Save result with metadata
-        results.append({
-            "id": sid, 
-            "file": sym.get("file", ""), 
-            "kind": item["kind"],
-            "raw": text
         })
 
+    # Generate prompt based on Kind; identical prompts (e.g. trivial getters) are sent only once
+    prompts = [get_prompt_by_kind(item) for item in items]
+    keys = [prompt_cache_key(args.model, prompt) for prompt in prompts]
+    texts = {}  # cache key -> generated text
+
+    cache_path = Path(args.cache_file) if args.cache_file else Path(args.output_file).parent / ".writer_cache"
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    # The shelf is only touched from this thread; workers just call the model
+    with shelve.open(str(cache_path)) as cache:
+        pending = {}  # cache key -> (id, prompt) still to be generated
+        for item, prompt, key in zip(items, prompts, keys):
+            if key in texts or key in pending:
+                continue
+            if not args.no_cache and key in cache:
+                texts[key] = cache[key]
+            else:
+                pending[key] = (item["id"], prompt)
+        print(f"[INFO] {len(items) - len(pending)} of {len(items)} docs served from cache or duplicates.")
+
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+            futures = {ex.submit(generate_doc, model, sid, prompt): key for key, (sid, prompt) in pending.items()}
+            for fut in as_completed(futures):
+                key = futures[fut]
+                text, ok = fut.result()
+                texts[key] = text
+                if ok:
+                    cache[key] = text
+
+    # Save result with metadata, in input order
+    results = [
+        {"id": item["id"], "file": item["file"], "kind": item["kind"], "raw": texts[key]}
+        for item, key in zip(items, keys)
+    ]
+
     out = {"model": args.model, "count": len(results), "items": results}
     save_json(out, Path(args.output_file))
     print(f"[INFO] Wrote {len(results)} doc entries -> {args.output_file}")
@@ -1,24 +1,69 @@
 import argparse
-import json
+import os
+import re
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 PROJECT_TOKEN = "PROJECT"
 
+# Cached per source file: (file bytes, byte offset of each line start + [file size]).
+# Only the lines a snippet needs are ever decoded.
+SourceEntry = Tuple[bytes, List[int]]
+# Line breaks as defined by LSP
+EOL_RE = re.compile(rb"\r\n|\r|\n")
+# An LSP range flattened to (start_line, start_char, end_line, end_char)
+Span = Tuple[int, int, int, int]
+
+# Symbol fields passed on to the writer, in output order; keys absent from a symbol stay absent
+SNIPPET_KEYS = ("id", "file", "name", "kind", "definitions", "calls", "calledBy")
+
+def make_snippet(sym: Dict[str, Any], sid: str, code: str) -> Dict[str, Any]:
+    """One output record: the symbol's SNIPPET_KEYS that are present, plus the sliced code."""
+    rec = {k: sym[k] for k in SNIPPET_KEYS if k in sym}
+    rec["id"] = sid
+    rec["code_snippet"] = code
+    return rec
+
 # ---------------- I/O utils ----------------
 
 def load_json(p: Path) -> Dict[str, Any]:
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 def save_json(obj: Any, p: Path) -> None:
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+def write_file_bytes(p: Path, data: bytes) -> None:
+    """Write bytes with a raw os.open/os.write (no buffered file object for each small snippet file)."""
+    fd = os.open(p, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
 
 # ---------------- path helpers ----------------
 
 def is_external_id(sym_id: str) -> bool:
     return isinstance(sym_id, str) and (sym_id.startswith("/") or sym_id.startswith("external:/"))
 
+@lru_cache(maxsize=None)
+def resolve_under_root(repo_root: Path, path_str: str) -> Path:
+    """
+    Resolve a 'PROJECT/...', relative or absolute path string against repo_root.
+    Cached: many symbols share the same file, and resolve() hits the filesystem.
+    """
+    if path_str.startswith(PROJECT_TOKEN + "/"):
+        return Path(path_str.replace(PROJECT_TOKEN, str(repo_root), 1)).resolve()
+    p = Path(path_str)
+    if not p.is_absolute():
+        return (repo_root / p).resolve()
+    return p.resolve()
+
 def resolve_file_path(repo_root: Path, file_field: Optional[str], sym_id: Optional[str]) -> Optional[Path]:
     """
     Resolve the real file path for this symbol.
@@ -28,92 +73,121 @@ def resolve_file_path(repo_root: Path, file_field: Optional[str], sym_id: Option
       3) If symbol id looks like '<abs>:name', use the absolute part.
     """
     if isinstance(file_field, str) and file_field:
-        if file_field.startswith(PROJECT_TOKEN + "/"):
-            return Path(file_field.replace(PROJECT_TOKEN, str(repo_root), 1)).resolve()
-        p = Path(file_field)
-        if not p.is_absolute():
-            return (repo_root / p).resolve()
-        return p.resolve()
+        return resolve_under_root(repo_root, file_field)
 
     # Fallback: parse from id "<abs-or-project-path>:<name>"
     if isinstance(sym_id, str) and ":" in sym_id:
         left = sym_id.rsplit(":", 1)[0]
-        if left.startswith(PROJECT_TOKEN + "/"):
-            return Path(left.replace(PROJECT_TOKEN, str(repo_root), 1)).resolve()
         p = Path(left)
-        return p if p.is_absolute() else (repo_root / p).resolve()
+        return p if p.is_absolute() else resolve_under_root(repo_root, left)
 
     return None
 
+# ---------------- source cache ----------------
+
+def compute_line_starts(buf: bytes) -> List[int]:
+    """
+    Byte offsets of each line start in `buf`, followed by len(buf) as a sentinel.
+    Lines end at CRLF, CR or LF (the LSP line breaks); a final line break does not start a new line.
+    """
+    starts = [0]
+    starts.extend(m.end() for m in EOL_RE.finditer(buf))
+    if starts[-1] != len(buf):
+        starts.append(len(buf))
+    return starts
+
+def load_source(p: Path, cache: Dict[Path, SourceEntry]) -> SourceEntry:
+    """
+    Return (buf, line_starts) for a source file, reading and indexing it only once.
+    Many symbols live in the same file, so main() keeps one cache for the whole run.
+    The file is read in one go and closed right away, so no descriptor stays open per cached file.
+    """
+    entry = cache.get(p)
+    if entry is None:
+        buf = p.read_bytes()
+        entry = (buf, compute_line_starts(buf))
+        cache[p] = entry
+    return entry
+
+def decode(b: bytes) -> str:
+    return b.decode("utf-8", errors="ignore")
+
+def line_text(src: SourceEntry, i: int) -> str:
+    """Decoded text of line i (0-based) without its line break."""
+    buf, starts = src
+    b = buf[starts[i]:starts[i + 1]]
+    if b.endswith(b"\r\n"):
+        b = b[:-2]
+    elif b.endswith((b"\n", b"\r")):
+        b = b[:-1]
+    return decode(b)
+
 # ---------------- range helpers ----------------
 
-def extract_by_lsp_range(text: str, rng: Dict[str, Any]) -> str:
+def range_to_span(rng: Dict[str, Any]) -> Span:
+    """Flatten an LSP Range dict once; the helpers below work on the tuple."""
+    s = rng.get("start") or {}
+    e = rng.get("end") or {}
+    return int(s.get("line", 0)), int(s.get("character", 0)), int(e.get("line", 0)), int(e.get("character", 0))
+
+def extract_by_lsp_range(src: SourceEntry, span: Span) -> str:
     """
     Extract code for an LSP Range. LSP ranges are half-open: [start, end).
-    We support multi-line and character-precise slicing.
+    We support multi-line and character-precise slicing (characters, not bytes).
+    Only the bytes of lines sl..el are decoded.
     """
-    lines = text.splitlines(keepends=True)  # preserve EOLs
-    s = rng.get("start", {})
-    e = rng.get("end", {})
-    sl, sc = int(s.get("line", 0)), int(s.get("character", 0))
-    el, ec = int(e.get("line", 0)), int(e.get("character", 0))
+    buf, line_starts = src
+    n_lines = len(line_starts) - 1
+    sl, sc, el, ec = span
 
-    if sl < 0 or el < 0 or sl >= len(lines):
+    if sl < 0 or el < 0 or sl >= n_lines:
+        return ""
+    if el >= n_lines:
+        el = n_lines - 1
+        ec = line_starts[el + 1] - line_starts[el]  # whole last line; clamped below
+    if el < sl:
         return ""
-    if el >= len(lines):
-        el = len(lines) - 1
-        ec = len(lines[el])
-
-    if sl == el:
-        return lines[sl][sc:ec]
-
-    parts: List[str] = []
-    parts.append(lines[sl][sc:])
-    for i in range(sl + 1, el):
-        parts.append(lines[i])
-    parts.append(lines[el][:ec])
-    return "".join(parts)
 
-def extend_upwards_for_decorators(full_text: str, rng: Dict[str, Any]) -> Dict[str, Any]:
+    seg = buf[line_starts[sl]:line_starts[el + 1]]
+    if seg.isascii():
+        # Characters are bytes: slice first, then decode only the result
+        first_len = line_starts[sl + 1] - line_starts[sl]
+        head_len = line_starts[el] - line_starts[sl]
+        last_len = line_starts[el + 1] - line_starts[el]
+        return seg[min(sc, first_len):head_len + min(ec, last_len)].decode("ascii")
+
+    # Columns past the end of a line (EOL included) clamp to the line end.
+    # Besides the segment itself, only its first and last lines are decoded (to measure them).
+    text = decode(seg)
+    first_len = len(decode(seg[:line_starts[sl + 1] - line_starts[sl]]))
+    last_len = first_len if sl == el else len(decode(seg[line_starts[el] - line_starts[sl]:]))
+    head_len = len(text) - last_len
+    return text[min(sc, first_len):head_len + min(ec, last_len)]
+
+def extend_upwards_for_decorators(src: SourceEntry, span: Span) -> Span:
     """
     Expand the range upwards to include contiguous decorators/comments/blank lines
     immediately above the function definition line.
     """
-    lines = full_text.splitlines()
-    s = dict(rng.get("start", {}))
-    el = int(rng.get("end", {}).get("line", s.get("line", 0)))
-
-    sl = int(s.get("line", 0))
+    sl, sc, el, ec = span
     while sl - 1 >= 0:
-        prev = lines[sl - 1].lstrip()
+        prev = line_text(src, sl - 1).lstrip()
         if prev.startswith("@") or prev.startswith("#") or prev == "":
             sl -= 1
         else:
             break
-    s["line"] = sl
-    new_rng = dict(rng)
-    new_rng["start"] = s
-    return new_rng
+    return sl, sc, el, ec
 
-def pad_range_by_lines(full_text: str, rng: Dict[str, Any], pad: int) -> Dict[str, Any]:
+def pad_range_by_lines(src: SourceEntry, span: Span, pad: int) -> Span:
     """
     Extend the range up/down by N full lines (not character-precise), bounded by file size.
     """
     if pad <= 0:
-        return rng
-    lines = full_text.splitlines()
-    s = dict(rng.get("start", {}))
-    e = dict(rng.get("end", {}))
-    sl = max(0, int(s.get("line", 0)) - pad)
-    el = min(len(lines) - 1, int(e.get("line", 0)) + pad)
-    s["line"] = sl
-    e["line"] = el
-    s["character"] = 0
-    e["character"] = len(lines[el]) if el < len(lines) else 0
-    out = dict(rng)
-    out["start"] = s
-    out["end"] = e
-    return out
+        return span
+    n_lines = len(src[1]) - 1
+    sl = max(0, span[0] - pad)
+    el = min(n_lines - 1, span[2] + pad)
+    return sl, 0, el, len(line_text(src, el)) if 0 <= el < n_lines else 0
 
 # ---------------- selection helpers ----------------
 
@@ -151,13 +225,16 @@ def main():
     symbols = data.get("symbols", [])
     want_ids = parse_ids_arg(args.only_ids)
 
-    # List to store processed symbol objects containing 'code_snippet'
+    # Processed symbols, each carrying its 'code_snippet'
     enriched_symbols: List[Dict[str, Any]] = []
-    ALLOWED_KEYS = ["id", "file", "name", "kind", "definitions", "calls", "calledBy", "code_snippet"]
 
     emit_dir = Path(args.emit_files).resolve() if args.emit_files else None
+    # file path -> (file bytes, line_starts); each source file is read and indexed once
+    source_cache: Dict[Path, SourceEntry] = {}
     if emit_dir:
         emit_dir.mkdir(parents=True, exist_ok=True)
+    # (path, encoded snippet) pairs written in parallel after the loop
+    emit_jobs: List[Tuple[Path, bytes]] = []
 
     for sym in symbols:
         sid = sym.get("id")
@@ -178,34 +255,35 @@ def main():
             continue
         
         # Error Handling: If file does not exist, keep the symbol but mark error in snippet
-        if not file_path.exists():
-            sym["code_snippet"] = f"# [ERROR] File not found: {file_path}"
-            filtered_sym = {k: sym.get(k) for k in ALLOWED_KEYS if k in sym}
-            enriched_symbols.append(filtered_sym)
+        if file_path not in source_cache and not file_path.exists():
+            enriched_symbols.append(make_snippet(sym, sid, f"# [ERROR] File not found: {file_path}"))
             continue
 
-        text = file_path.read_text(encoding="utf-8", errors="ignore")
+        src = load_source(file_path, source_cache)
 
         # Range expansion logic
-        eff_range = dict(rng)
+        span = range_to_span(rng)
         if args.include_decorators:
-            eff_range = extend_upwards_for_decorators(text, eff_range)
+            span = extend_upwards_for_decorators(src, span)
 
         if args.pad_lines and args.pad_lines > 0:
-            eff_range = pad_range_by_lines(text, eff_range, args.pad_lines)
+            span = pad_range_by_lines(src, span, args.pad_lines)
 
         # Extract source code
-        code = extract_by_lsp_range(text, eff_range)
+        code = extract_by_lsp_range(src, span)
 
-        # [Modification] Inject code_snippet directly into the symbol object
-        sym["code_snippet"] = code
-        filtered_sym = {k: sym.get(k) for k in ALLOWED_KEYS if k in sym}
-        enriched_symbols.append(filtered_sym)
+        enriched_symbols.append(make_snippet(sym, sid, code))
 
         # Optional: Write individual .py files
         if emit_dir:
             safe_name = sid.replace("/", "_").replace(":", "__")
-            (emit_dir / f"{safe_name}.py").write_text(code, encoding="utf-8")
+            emit_jobs.append((emit_dir / f"{safe_name}.py", code.encode("utf-8")))
+
+    if emit_jobs:
+        # File writes release the GIL, so a small thread pool overlaps the open/write/close syscalls
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            for _ in ex.map(lambda job: write_file_bytes(*job), emit_jobs):
+                pass
 
     # [Modification] Overwrite the original symbols list with the enriched list
     data["symbols"] = enriched_symbols
@@ -1,38 +1,57 @@
-import json
+import orjson
+import heapq
 import argparse
 from pathlib import Path
 from collections import defaultdict, deque
-from typing import Dict, Any, List, Set
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 # ---------- helpers ----------
 
 def load_json(p: Path) -> Dict[str, Any]:
-    return json.loads(p.read_text(encoding="utf-8"))
+    return orjson.loads(p.read_bytes())
 
 def save_json(obj: Dict[str, Any], p: Path) -> None:
     p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    p.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
 def is_external(sym_id: str) -> bool:
     # External nodes are absolute-path based or explicitly marked 'external:/'
     return sym_id.startswith("/") or sym_id.startswith("external:/")
 
+def partition_ids(symbols: List[Dict[str, Any]]) -> Tuple[Set[str], Set[str]]:
+    """
+    Split symbol IDs into (project_ids, external_ids) in one pass,
+    so later loops use set membership instead of re-checking prefixes.
+    """
+    ids: Set[str] = set()
+    externals: Set[str] = set()
+    for s in symbols:
+        sid = s.get("id")
+        if not isinstance(sid, str):
+            continue
+        if is_external(sid):
+            externals.add(sid)
+        else:
+            ids.add(sid)
+    return ids, externals
+
 # ---------- topo sort core ----------
 
-def topo_order(symbols: List[Dict[str, Any]], reverse: bool = False) -> List[str]:
+def topo_order(symbols: List[Dict[str, Any]], reverse: bool = False, project_ids: Optional[Set[str]] = None) -> List[str]:
     """
     Produce a topological order of in-project symbols using `calls` edges.
     - Nodes:   all in-project symbol IDs present in `symbols`.
     - Edges:   sid -> d for each d in symbol.calls if d is also in-project.
     - reverse: if True, return reverse topological order (high-level first).
+    - project_ids: partition_ids(symbols)[0] if the caller already has it; computed otherwise.
     """
-    ids: Set[str] = {s.get("id") for s in symbols if isinstance(s.get("id"), str) and not is_external(s["id"])}
+    ids = project_ids if project_ids is not None else partition_ids(symbols)[0]
     out_e = defaultdict(set)
     in_deg = {sid: 0 for sid in ids}
 
     for s in symbols:
         sid = s.get("id")
-        if not isinstance(sid, str) or is_external(sid):
+        if sid not in ids:
             continue
         for d in (s.get("calls") or []):
             if d in ids:
@@ -41,20 +60,21 @@ def topo_order(symbols: List[Dict[str, Any]], reverse: bool = False) -> List[str
                     in_deg[d] += 1
         _ = out_e[sid]  # ensure key exists
 
-    # Kahn's algorithm
-    q = sorted([v for v, d in in_deg.items() if d == 0])
+    # Kahn's algorithm; the min-heap always yields the smallest ready id (deterministic)
+    q = [v for v, d in in_deg.items() if d == 0]
+    heapq.heapify(q)
     order: List[str] = []
     while q:
-        v = q.pop(0)
+        v = heapq.heappop(q)
         order.append(v)
-        for w in sorted(out_e.get(v, [])):
+        for w in out_e.get(v, ()):
             in_deg[w] -= 1
             if in_deg[w] == 0:
-                q.append(w)
-        q.sort()
+                heapq.heappush(q, w)
 
     # If cycles remain, append them in deterministic order
-    remaining = sorted([v for v, d in in_deg.items() if d > 0 and v not in order])
+    # (nodes with in-degree left were never queued, so none of them is in `order`)
+    remaining = sorted([v for v, d in in_deg.items() if d > 0])
     order.extend(remaining)
 
     return list(reversed(order)) if reverse else order
@@ -75,16 +95,17 @@ def main():
     symbols = data.get("symbols", [])
     externals = data.get("externals", [])
 
-    order = topo_order(symbols, reverse=True)
+    project_ids, external_ids = partition_ids(symbols)
+    order = topo_order(symbols, reverse=True, project_ids=project_ids)
     pos = {sid: i for i, sid in enumerate(order)}
 
     # Reorder project symbols by topo index; keep stable tie-breaker by id
-    proj_syms = [s for s in symbols if isinstance(s.get("id"), str) and not is_external(s["id"])]
+    proj_syms = [s for s in symbols if s.get("id") in project_ids]
     proj_syms_sorted = sorted(proj_syms, key=lambda s: (pos.get(s["id"], 10**9), s["id"]))
 
     if args.keep_externals:
         # Keep externals in original appearance order at the end
-        final_syms = proj_syms_sorted + [s for s in symbols if is_external(s.get("id", ""))]
+        final_syms = proj_syms_sorted + [s for s in symbols if s.get("id") in external_ids]
     else:
         final_syms = proj_syms_sorted  # drop externals from symbols list
 
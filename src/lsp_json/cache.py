@@ -0,0 +1,44 @@
+import hashlib
+from pathlib import Path
+from typing import Callable, List
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def stamp_path(out: Path) -> Path:
+    """Sidecar file holding the input digest an output was built from: '<out>.sha256'."""
+    return out.with_name(out.name + ".sha256")
+
+
+def input_digest(inputs: List[Path], version: str) -> str:
+    """
+    SHA256 over the contents of all inputs (in order) plus a version string.
+    Stages pass their own source file as an input, so code changes invalidate the cache,
+    and put output-affecting options into `version`.
+    """
+    h = hashlib.sha256()
+    for p in inputs:
+        with p.open("rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    h.update(version.encode("utf-8"))
+    return h.hexdigest()
+
+
+def cached(fn: Callable[[], None], inputs: List[Path], out: Path, version: str = "", enabled: bool = True) -> bool:
+    """
+    Run fn() (which writes `out`) unless `out` was already built from identical inputs.
+    This module's own source is always part of the key, so changing the cache logic invalidates every stamp.
+    Returns True if the stage was skipped. The stamp is written only after fn() succeeds.
+    """
+    stamp = stamp_path(out)
+    digest = input_digest([*inputs, Path(__file__)], version)
+    if enabled and out.exists() and stamp.exists() and stamp.read_text(encoding="utf-8").strip() == digest:
+        print(f"[INFO] Inputs unchanged; reusing {out}")
+        return True
+
+    fn()
+    stamp.write_text(digest + "\n", encoding="utf-8")
+    return False
@@ -1,13 +1,20 @@
-import json
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional, DefaultDict
 from collections import defaultdict
 import argparse
+import sys
+
+import orjson
+
+from cache import cached
 
 
 # Inputs
 DEFAULT_OUT_ROOT = Path("data/lsp_json_outputs")
 PROJECT_TOKEN = "PROJECT"  # must match your prune step
+PROJECT_PREFIX = PROJECT_TOKEN + "/"
+PROJECT_PREFIX_LEN = len(PROJECT_PREFIX)
 
 
 # -----------------------------
@@ -21,8 +28,8 @@ def to_project_rel(path_str: str) -> Tuple[bool, str]:
     """
     if not isinstance(path_str, str):
         return False, path_str
-    if path_str.startswith(PROJECT_TOKEN + "/"):
-        return True, path_str[len(PROJECT_TOKEN) + 1 :]
+    if path_str.startswith(PROJECT_PREFIX):
+        return True, path_str[PROJECT_PREFIX_LEN:]
     return False, path_str
 
 
@@ -35,9 +42,16 @@ def normalize_external_path(s: str) -> str:
     If it contains '/usr/', take substring from first '/usr/'.
     Otherwise, if it looks absolute already, return as-is.
     Otherwise, try Path(s).resolve() (may depend on CWD).
+    Non-strings are returned unchanged without touching the cache, since they may be unhashable.
     """
     if not isinstance(s, str):
         return s
+    return _normalize_str_path(s)
+
+
+@lru_cache(maxsize=None)
+def _normalize_str_path(s: str) -> str:
+    """Cached body of normalize_external_path for strings."""
     if "/usr/" in s:
         return s[s.index("/usr/") :]
     if s.startswith("/"):
@@ -54,18 +68,28 @@ def parse_dep_endpoint(ep: str) -> Tuple[str, str]:
     or '/usr/lib/python3.10/csv.py:csv'
     or 'PROJECT/data/test_project/data_utils.py:load_data'.
     Returns (file_or_abs, name).
+    Non-string endpoints (malformed deps JSON) are returned as (ep, "") without touching the cache,
+    since they may be unhashable.
     """
-    if not isinstance(ep, str) or ":" not in ep:
+    if not isinstance(ep, str):
+        return ep, ""
+    return _parse_str_endpoint(ep)
+
+
+@lru_cache(maxsize=None)
+def _parse_str_endpoint(ep: str) -> Tuple[str, str]:
+    """Cached body of parse_dep_endpoint for string endpoints."""
+    if ":" not in ep:
         return ep, ""
     file_part, name = ep.rsplit(":", 1)
     # If looks external weird relative into /usr/, normalize
     if "/usr/" in file_part and not file_part.startswith("/usr/"):
         file_part = normalize_external_path(file_part)
-    return file_part, name
+    return sys.intern(file_part), sys.intern(name)
 
 
 def load_json(path: Path) -> Dict[str, Any]:
-    return json.loads(path.read_text(encoding="utf-8"))
+    return orjson.loads(path.read_bytes())
 
 
 # -----------------------------
@@ -92,7 +116,7 @@ def compute_symbol_id(sym: Dict[str, Any]) -> Optional[str]:
     # Fallback when no definitions (rare for imports/constants)
     file_rel = sym.get("file")
     if isinstance(file_rel, str) and file_rel:
-        return f"{PROJECT_TOKEN}/{file_rel}:{name}"
+        return f"{PROJECT_PREFIX}{file_rel}:{name}"
 
     return None
 
@@ -121,17 +145,20 @@ def build_indices(pruned: Dict[str, Any]) -> Tuple[Dict[str, Dict[str, Any]], Di
         sid = compute_symbol_id(sym)
         if not sid:
             continue
+        # IDs are repeated across calls/calledBy and the index; keep one copy of each
+        sid = sys.intern(sid)
         # attach id shallowly
         sym_copy = {"id": sid}
         sym_copy.update(sym) 
-        sym_copy.setdefault("calls", [])
-        sym_copy.setdefault("calledBy", [])
+        # Sets while wiring edges; integrate() turns them into sorted lists
+        sym_copy["calls"] = set(sym.get("calls") or ())
+        sym_copy["calledBy"] = set(sym.get("calledBy") or ())
         by_id[sid] = sym_copy
 
         f = sym.get("file")
         n = sym.get("name")
         if isinstance(f, str) and isinstance(n, str):
-            by_file_name[(f, n)] = sid
+            by_file_name[(sys.intern(f), sys.intern(n))] = sid
 
     return by_id, by_file_name
 
@@ -149,18 +176,23 @@ def integrate(pruned: Dict[str, Any], deps: Dict[str, Any]) -> Dict[str, Any]:
     by_id, by_file_name = build_indices(pruned)
     externals: Dict[str, Dict[str, Any]] = {}
 
+    # Hot-loop locals: bound methods instead of attribute lookups per endpoint/edge
+    by_file_name_get = by_file_name.get
+    by_id_get = by_id.get
+
+    # Pure given by_file_name, which is fixed from here on; the cache lives for this call only
+    @lru_cache(maxsize=None)
     def id_from_dep_endpoint(ep: str) -> Optional[str]:
         file_part, name = parse_dep_endpoint(ep)
         if not name:
             return None
 
         # Project-style endpoint: either 'PROJECT/..' or bare 'file.py'
-        if file_part.startswith(PROJECT_TOKEN + "/"):
+        if file_part.startswith(PROJECT_PREFIX):
             # Project path already normalized; map back to symbol id by definitions if exists
             # Try to find the symbol whose id starts with this file_part and name
             # Or fall back to file/name index (strip PROJECT/)
-            proj_rel = file_part[len(PROJECT_TOKEN) + 1 :]
-            sid = by_file_name.get((proj_rel, name))
+            sid = by_file_name_get((file_part[PROJECT_PREFIX_LEN:], name))
             if sid:
                 return sid
             # Fallback: construct ID even if not found in index
@@ -168,11 +200,11 @@ def integrate(pruned: Dict[str, Any], deps: Dict[str, Any]) -> Dict[str, Any]:
 
         # Bare relative (e.g., 'data_utils.py') – treat as project file key
         if not file_part.startswith("/"):
-            sid = by_file_name.get((file_part, name))
+            sid = by_file_name_get((file_part, name))
             if sid:
                 return sid
             # If not found, construct PROJECT-based fallback
-            return f"{PROJECT_TOKEN}/{file_part}:{name}"
+            return f"{PROJECT_PREFIX}{file_part}:{name}"
 
         # Absolute/external
         abs_norm = normalize_external_path(file_part)
@@ -190,29 +222,30 @@ def integrate(pruned: Dict[str, Any], deps: Dict[str, Any]) -> Dict[str, Any]:
         if not src_id or not dst_id:
             continue
 
+        src_sym = by_id_get(src_id)
+        dst_sym = by_id_get(dst_id)
+
         # Ensure externals exist if not project symbol
-        if src_id not in by_id and src_id not in externals:
+        if src_sym is None and src_id not in externals:
             f, n = parse_dep_endpoint(src_raw)
             if f.startswith("/"):
                 externals[src_id] = {"id": src_id, "absolutePath": normalize_external_path(f), "name": n}
-        if dst_id not in by_id and dst_id not in externals:
+        if dst_sym is None and dst_id not in externals:
             f, n = parse_dep_endpoint(dst_raw)
             if f.startswith("/"):
                 externals[dst_id] = {"id": dst_id, "absolutePath": normalize_external_path(f), "name": n}
 
         # Attach edges if the target symbol is in-project
-        if src_id in by_id:
-            if dst_id not in by_id[src_id]["calls"]:
-                by_id[src_id]["calls"].append(dst_id)
-        if dst_id in by_id:
-            if src_id not in by_id[dst_id]["calledBy"]:
-                by_id[dst_id]["calledBy"].append(src_id)
+        if src_sym is not None:
+            src_sym["calls"].add(dst_id)
+        if dst_sym is not None:
+            dst_sym["calledBy"].add(src_id)
 
     # Sort stable
     symbols_out = list(by_id.values())
     for s in symbols_out:
-        s["calls"].sort()
-        s["calledBy"].sort()
+        s["calls"] = sorted(s["calls"])
+        s["calledBy"] = sorted(s["calledBy"])
 
     result = {
         "projectRootToken": PROJECT_TOKEN,
@@ -223,37 +256,43 @@ def integrate(pruned: Dict[str, Any], deps: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 
+def run_step(in_file: Path, deps_file: Path, output_dir: Path, output_name: str = "final_integrated.json", use_cache: bool = True) -> Path:
+    """Integrate pruned + deps JSON into output_dir/output_name; shared by main() and pipeline.py. Returns the output path."""
+    in_file = Path(in_file).resolve()
+    deps_file = Path(deps_file).resolve()
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_file = output_dir / output_name
+
+    def run():
+        # Load pruned and deps JSON
+        pruned_json = load_json(in_file)
+        deps_json = load_json(deps_file)
+
+        # Integrate both
+        final_json = integrate(pruned_json, deps_json)
+
+        out_file.write_bytes(orjson.dumps(final_json, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+        print(f"[INFO] Saved integrated JSON → {out_file}")
+
+    # Skip the stage if both inputs and this script are unchanged since the last build of out_file.
+    # CWD is part of the key because normalize_external_path may resolve relative paths against it.
+    cached(run, [in_file, deps_file, Path(__file__)], out_file, version=str(Path.cwd()), enabled=use_cache)
+    return out_file
+
+
 def main():
     parser = argparse.ArgumentParser(description="Integrate pruned dependency JSON into final structure.")
     parser.add_argument("--input-file", required=True, help="Pruned JSON file.")
     parser.add_argument("--deps-file", required=True, help="Dependencies JSON file.")
     parser.add_argument("--output-dir", help="Directory to store final JSON.")
     parser.add_argument("--output-name", default="final_integrated.json", help="Output filename.")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild even if the inputs are unchanged since the last run.")
     args = parser.parse_args()
 
-    in_file = Path(args.input_file).resolve()
-    deps_file = Path(args.deps_file).resolve()
-
-    if args.output_dir:
-        output_dir = Path(args.output_dir).resolve()
-    else:
-        output_dir = DEFAULT_OUT_ROOT.resolve()
-    output_dir.mkdir(parents=True, exist_ok=True)
-    out_file = output_dir / args.output_name
-
-    # Load pruned and deps JSON
-    with in_file.open("r", encoding="utf-8") as f:
-        pruned_json = json.load(f)
-    with deps_file.open("r", encoding="utf-8") as f:
-        deps_json = json.load(f)
-
-    # Integrate both
-    final_json = integrate(pruned_json, deps_json)
-
-    with out_file.open("w", encoding="utf-8") as f:
-        json.dump(final_json, f, ensure_ascii=False, indent=2)
-
-    print(f"[INFO] Saved integrated JSON → {out_file}")
+    output_dir = Path(args.output_dir) if args.output_dir else DEFAULT_OUT_ROOT
+    run_step(Path(args.input_file), Path(args.deps_file), output_dir, args.output_name, use_cache=not args.no_cache)
 
 
 
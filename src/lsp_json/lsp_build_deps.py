@@ -1,124 +1,282 @@
-import json
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional, Set
 import argparse
+import re
+import sys
+
+import msgspec
+import numpy as np
+import orjson
+
+from cache import cached
 
 
 DEFAULT_OUT_ROOT = Path("data/lsp_json_outputs")
+# Upper bound on refs x symbols cells in one enclosure broadcast (bounds temporary memory)
+MAX_BROADCAST_CELLS = 1 << 22
+# Same as line.strip().startswith(("import ", "from ")): keyword + space, then something non-blank
+IMPORT_RE = re.compile(r"\s*(?:import|from) .*\S", re.S)
+
+
+# ---------------------------
+# Typed input model
+# ---------------------------
+# Only the fields this stage reads are declared; msgspec skips the rest (hover, selectionRange, ...)
+# while decoding. Missing fields default to None / empty, as the dict .get() lookups did.
+
+class Position(msgspec.Struct):
+    line: Optional[int] = None
+    character: Optional[int] = None
+
+
+class Range(msgspec.Struct):
+    start: Optional[Position] = None
+    end: Optional[Position] = None
+
+
+class Location(msgspec.Struct):
+    relativePath: Optional[str] = None
+    absolutePath: Optional[str] = None
+    range: Optional[Range] = None
+
+
+class Symbol(msgspec.Struct):
+    name: Optional[str] = None
+    kind: Optional[int] = None
+    range: Optional[Range] = None
+    references: Optional[List[Location]] = None
+    definitions: Optional[List[Location]] = None
+
+
+class FileEntry(msgspec.Struct):
+    file: Optional[str] = None
+    symbols: List[Symbol] = []
+
+
+class PerFileDoc(msgspec.Struct):
+    files: List[FileEntry] = []
+
+
+PER_FILE_DECODER = msgspec.json.Decoder(PerFileDoc, strict=False)
+FILE_ENTRY_DECODER = msgspec.json.Decoder(FileEntry, strict=False)
+NO_POSITION = Position()
+
+
+def load_per_file(path: Path) -> PerFileDoc:
+    """Decode a per-file JSON: '.ndjson' (header line, then one file entry per line) or a single document."""
+    if path.suffix != ".ndjson":
+        return PER_FILE_DECODER.decode(path.read_bytes())
+    with path.open("rb") as f:
+        next(f, None)  # header: repo_root / language
+        return PerFileDoc(files=[FILE_ENTRY_DECODER.decode(line) for line in f if line.strip()])
 
 
 # ---------------------------
 # Helpers for range handling
 # ---------------------------
 
-def pos_in_range(line: int, ch: int, rng: Dict[str, Any]) -> bool:
-    """Return True if (line, ch) is inside the given LSP range [start, end)."""
-    if not isinstance(rng, dict):
-        return False
-    s = rng.get("start") or {}
-    e = rng.get("end") or {}
-    sl, sc = int(s.get("line", 10**9)), int(s.get("character", 10**9))
-    el, ec = int(e.get("line", -1)), int(e.get("character", -1))
-    if (line < sl) or (line > el):
-        return False
-    if line == sl and ch < sc:
-        return False
-    if line == el and ch >= ec:
-        return False
-    return True
+def range_bounds(rng: Optional[Range]) -> Tuple[int, int, int, int]:
+    """
+    Return (sl, sc, el, ec) containment bounds of an LSP range. Missing start fields default to 10**9
+    and missing end fields to -1, so an incomplete range contains nothing.
+    """
+    s = (rng.start if rng is not None else None) or NO_POSITION
+    e = (rng.end if rng is not None else None) or NO_POSITION
+    return (
+        s.line if s.line is not None else 10**9,
+        s.character if s.character is not None else 10**9,
+        e.line if e.line is not None else -1,
+        e.character if e.character is not None else -1,
+    )
 
 
-def symbol_span(sym: Dict[str, Any]) -> Tuple[int, int, int, int]:
+def symbol_span(sym: Symbol) -> Tuple[int, int, int, int]:
     """Return (sl, sc, el, ec) for a symbol's range; defaults to zeros if missing."""
-    rng = sym.get("range") or {}
-    s = rng.get("start") or {}
-    e = rng.get("end") or {}
-    return int(s.get("line", 0)), int(s.get("character", 0)), int(e.get("line", 0)), int(e.get("character", 0))
+    rng = sym.range
+    s = (rng.start if rng is not None else None) or NO_POSITION
+    e = (rng.end if rng is not None else None) or NO_POSITION
+    return s.line or 0, s.character or 0, e.line or 0, e.character or 0
 
 
 # ---------------------------
 # Indexing and file helpers
 # ---------------------------
 
-def build_symbol_index(files: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
-    """Map file (relative path key) -> list of symbols (keeps ranges for caller locating)."""
-    idx: Dict[str, List[Dict[str, Any]]] = {}
+def build_file_symbol_index(symbols: List[Symbol]) -> Dict[str, Any]:
+    """
+    Per-file struct-of-arrays for find_enclosing_symbols. Symbols with a usable range are sorted
+    by start line; row k of every array describes symbols[k]:
+      sl, sc, el, ec : containment bounds (range_bounds defaults for missing fields)
+      rank           : position in preference order (kind preference, span score, original position);
+                       the original position keeps ties in file order
+    """
+    entries: List[Tuple[int, int, int, int, Tuple[int, int, int], Symbol]] = []
+    for i, s in enumerate(symbols):
+        sl, sc, el, ec = range_bounds(s.range)
+        ssl, ssc, sel, sec = symbol_span(s)
+        span_score = (sel - ssl) * 10_000 + (sec - ssc)
+        # Prefer method(6)/function(12)
+        pref = 0 if s.kind in (6, 12) else 1
+        # Keep only what caller lookup needs, so the index does not pin every symbol's references
+        slim = Symbol(name=sys.intern(s.name) if s.name is not None else None, kind=s.kind, range=s.range)
+        entries.append((sl, sc, el, ec, (pref, span_score, i), slim))
+    entries.sort(key=lambda t: (t[0], t[4]))
+    rank = np.empty(len(entries), dtype=np.int64)
+    rank[sorted(range(len(entries)), key=lambda k: entries[k][4])] = np.arange(len(entries))
+    return {
+        "symbols": [t[5] for t in entries],
+        "sl": np.array([t[0] for t in entries], dtype=np.int64),
+        "sc": np.array([t[1] for t in entries], dtype=np.int64),
+        "el": np.array([t[2] for t in entries], dtype=np.int64),
+        "ec": np.array([t[3] for t in entries], dtype=np.int64),
+        "rank": rank,
+    }
+
+
+def build_symbol_index(files: List[FileEntry]) -> Dict[str, Dict[str, Any]]:
+    """Map file (relative path key) -> per-file symbol lookup structure (see build_file_symbol_index)."""
+    idx: Dict[str, Dict[str, Any]] = {}
     for fe in files:
-        fname = fe.get("file")
-        if isinstance(fname, str):
-            idx[fname] = fe.get("symbols", [])
+        if fe.file is not None:
+            # Interned: index keys come back as ref_file_key for every reference
+            idx[sys.intern(fe.file)] = build_file_symbol_index(fe.symbols)
     return idx
 
 
-def normalize_ref_file(ref_file: str, index_keys: List[str]) -> Optional[str]:
+def build_key_index(index_keys: List[str]) -> Dict[str, Any]:
     """
-    Try to map a reference file path (relative or absolute) to an index key (relative path).
-    Heuristics: exact match -> endswith match -> basename match.
+    Precompute lookup structures for normalize_ref_file once, instead of scanning all keys per reference:
+      trie     : suffix trie over reversed path components; each node is
+                 {"children": part -> node, "key": key ending exactly here or None,
+                  "first": earliest key (in index order) at or below this node}
+      keys     : set of index keys, for exact matches
+      by_base  : basename -> first key with that basename
+      memo     : ref_file -> resolved key (or None); references repeat the same few files
     """
-    if ref_file in index_keys:
-        return ref_file
-    for k in index_keys:
-        if k.endswith(ref_file) or ref_file.endswith(k):
-            return k
-    # As a last resort, try basename match
-    ref_base = Path(ref_file).name
+    trie: Dict[str, Any] = {"children": {}, "key": None, "first": None}
+    by_base: Dict[str, str] = {}
     for k in index_keys:
-        if Path(k).name == ref_base:
-            return k
-    return None
+        node = trie
+        if node["first"] is None:
+            node["first"] = k
+        for part in reversed(Path(k).parts):
+            node = node["children"].setdefault(part, {"children": {}, "key": None, "first": None})
+            if node["first"] is None:
+                node["first"] = k
+        if node["key"] is None:
+            node["key"] = k
+        by_base.setdefault(Path(k).name, k)
+    return {
+        "trie": trie,
+        "keys": set(index_keys),
+        "by_base": by_base,
+        "memo": {},
+    }
+
+
+def normalize_ref_file(ref_file: str, key_index: Dict[str, Any]) -> Optional[str]:
+    """
+    Try to map a reference file path (relative or absolute) to an index key (relative path).
+    Heuristics, comparing whole path components: exact match -> a key ending with ref_file
+    (earliest in index order) -> the longest key that ref_file ends with -> basename match.
+    `key_index` comes from build_key_index().
+    """
+    memo = key_index["memo"]
+    if ref_file in memo:
+        return memo[ref_file]
+
+    if ref_file in key_index["keys"]:
+        result: Optional[str] = ref_file
+    else:
+        # Walk ref_file's components from the basename up, remembering the deepest key passed
+        node = key_index["trie"]
+        longest: Optional[str] = None
+        consumed = True
+        for part in reversed(Path(ref_file).parts):
+            node = node["children"].get(part)
+            if node is None:
+                consumed = False
+                break
+            if node["key"] is not None:
+                longest = node["key"]
+        if consumed and node["first"] is not None:
+            # ref_file is a component suffix of these keys (e.g. 'utils.py' -> 'pkg/utils.py')
+            result = node["first"]
+        elif longest is not None:
+            # A key is a component suffix of ref_file (e.g. '/abs/repo/pkg/utils.py' -> 'pkg/utils.py')
+            result = longest
+        else:
+            # As a last resort, try basename match
+            result = key_index["by_base"].get(Path(ref_file).name)
+
+    memo[ref_file] = result
+    return result
+
+
+@lru_cache(maxsize=256)
+def read_file_lines(abs_path: str) -> Optional[Tuple[str, ...]]:
+    """
+    Read a file once and keep its lines (without trailing newline); None if unreadable.
+    References cluster in a few files, so this replaces re-reading the file for every reference.
+    """
+    try:
+        with open(abs_path, "r", encoding="utf-8", errors="ignore") as f:
+            return tuple(l.rstrip("\n") for l in f)
+    except Exception:
+        return None
 
 
 def get_line_text(abs_path: Optional[str], line: int) -> Optional[str]:
     """Best-effort read one line (0-based) from abs_path; return None if not available."""
     if not isinstance(abs_path, str):
         return None
-    p = Path(abs_path)
-    if not p.exists():
+    lines = read_file_lines(abs_path)
+    if lines is None or not 0 <= line < len(lines):
         return None
-    try:
-        with p.open("r", encoding="utf-8", errors="ignore") as f:
-            for i, l in enumerate(f):
-                if i == line:
-                    return l.rstrip("\n")
-    except Exception:
-        return None
-    return None
+    return lines[line]
 
 
 # ---------------------------
 # Caller locating
 # ---------------------------
 
-def find_enclosing_symbol(symbols: List[Dict[str, Any]], line: int, ch: int) -> Optional[Dict[str, Any]]:
+def find_enclosing_symbols(file_index: Dict[str, Any], lines: np.ndarray, chs: np.ndarray) -> np.ndarray:
     """
-    Find the innermost symbol whose range encloses (line, ch).
-    Prefer function/method kinds and smaller spans.
+    Find the innermost enclosing symbol, preferring function/method kinds and smaller spans:
+    for each (lines[r], chs[r]) the position in file_index["symbols"] of that symbol, or -1 if none.
+    A position is enclosed by a range [start, end). Refs x symbols are tested as one broadcast per chunk.
     """
-    candidates: List[Dict[str, Any]] = []
-    for s in symbols:
-        if pos_in_range(line, ch, s.get("range") or {}):
-            candidates.append(s)
-    if not candidates:
-        return None
-
-    def sort_key(s: Dict[str, Any]) -> Tuple[int, int]:
-        sl, sc, el, ec = symbol_span(s)
-        span_score = (el - sl) * 10_000 + (ec - sc)
-        kind = s.get("kind")
-        # Prefer method(6)/function(12)
-        pref = 0 if kind in (6, 12) else 1
-        return (pref, span_score)
-
-    candidates.sort(key=sort_key)
-    return candidates[0]
+    out = np.full(len(lines), -1, dtype=np.int64)
+    n_syms = len(file_index["symbols"])
+    if n_syms == 0 or len(lines) == 0:
+        return out
+    no_rank = np.iinfo(np.int64).max
+    step = max(1, MAX_BROADCAST_CELLS // n_syms)
+    for lo in range(0, len(lines), step):
+        ln = lines[lo:lo + step, None]
+        ch = chs[lo:lo + step, None]
+        # Symbols starting after the last ref line can never enclose any ref in this chunk
+        hi = int(np.searchsorted(file_index["sl"], ln.max(), side="right"))
+        if hi == 0:
+            continue
+        sl, sc = file_index["sl"][:hi], file_index["sc"][:hi]
+        el, ec = file_index["el"][:hi], file_index["ec"][:hi]
+        mask = (ln >= sl) & (ln <= el) & ~((ln == sl) & (ch < sc)) & ~((ln == el) & (ch >= ec))
+        ranks = np.where(mask, file_index["rank"][:hi], no_rank)
+        best = ranks.argmin(axis=1)
+        found = ranks[np.arange(len(best)), best] != no_rank
+        out[lo:lo + step] = np.where(found, best, -1)
+    return out
 
 
+@lru_cache(maxsize=4096)
 def looks_like_import(line_text: Optional[str]) -> bool:
     """Simple heuristic to detect import lines in Python."""
     if not line_text:
         return False
-    t = line_text.strip()
-    return t.startswith("import ") or t.startswith("from ")
+    return IMPORT_RE.match(line_text) is not None
 
 
 def looks_like_call_context(line_text: Optional[str], col: Optional[int]) -> bool:
@@ -128,29 +286,27 @@ def looks_like_call_context(line_text: Optional[str], col: Optional[int]) -> boo
     """
     if line_text is None or col is None:
         return True
-    # Allow some spaces between name and '('
-    tail = line_text[col: col + 64]
-    # Find first '(' after some chars; crude but effective for Python
-    return "(" in tail
+    # Allow some spaces between name and '('; crude but effective for Python.
+    # find() with slice bounds avoids copying the tail
+    return line_text.find("(", col, col + 64) != -1
 
 
 # ---------------------------
 # Callee canonicalization
 # ---------------------------
 
-def canonicalize_callee(sym: Dict[str, Any], fallback_file: str) -> Tuple[str, str]:
+def canonicalize_callee(sym: Symbol, fallback_file: str) -> Tuple[str, str]:
     """
     Return (callee_file, callee_name) canonicalized to the definition file if available.
     If no definition is present, fallback to current file.
     """
-    callee_name = sym.get("name")
-    if not isinstance(callee_name, str):
+    callee_name = sym.name
+    if callee_name is None:
         return fallback_file, "<unknown>"
 
-    defs = sym.get("definitions") or []
-    if defs and isinstance(defs, list) and isinstance(defs[0], dict):
-        def_path = defs[0].get("relativePath") or defs[0].get("absolutePath")
-        if isinstance(def_path, str):
+    if sym.definitions:
+        def_path = sym.definitions[0].relativePath or sym.definitions[0].absolutePath
+        if def_path is not None:
             return def_path, callee_name
     return fallback_file, callee_name
 
@@ -159,7 +315,122 @@ def canonicalize_callee(sym: Dict[str, Any], fallback_file: str) -> Tuple[str, s
 # Core dependency builder
 # ---------------------------
 
-def build_dependencies(data: Dict[str, Any]) -> Dict[str, Any]:
+def collect_file_edges(
+    file_entry: FileEntry,
+    index: Dict[str, Dict[str, Any]],
+    key_index: Dict[str, Any],
+) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    """
+    Function edges contributed by the callee symbols of one file entry, deduplicated in discovery order:
+    (caller_id, callee_id) -> (caller_file, callee_file).
+    References passing the text heuristics are gathered first, then callers are located
+    with one batched enclosure test per referencing file.
+    """
+    func_edges: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    callee_file_rel = file_entry.file
+    if callee_file_rel is None:
+        return func_edges
+
+    # (callee_id, callee_name, callee_file_key, ref_file_key) per candidate ref, in discovery order
+    cands: List[Tuple[str, str, str, str]] = []
+    # ref_file_key -> ([candidate position], [line], [character])
+    by_ref_file: Dict[str, Tuple[List[int], List[int], List[int]]] = {}
+
+    for sym in file_entry.symbols:
+        # Canonicalize callee to its definition file if available
+        canon_file, callee_name = canonicalize_callee(sym, callee_file_rel)
+        callee_file_key = normalize_ref_file(canon_file, key_index) or canon_file
+        callee_id = sys.intern(f"{callee_file_key}:{callee_name}")
+
+        # Callee's own definition range (to ignore self-definition as ref)
+        callee_start = sym.range.start if sym.range is not None else None
+        callee_def_line = callee_start.line if callee_start is not None else None
+
+        for ref in sym.references or []:
+            ref_file = ref.relativePath or ref.absolutePath
+            ref_rng = ref.range
+            if ref_file is None or ref_rng is None:
+                continue
+
+            # Skip import lines (not a call)
+            abs_path = ref.absolutePath
+            start = ref_rng.start or NO_POSITION
+            line = start.line
+            col = start.character
+            ref_line_text = get_line_text(abs_path, int(line)) if isinstance(line, int) else None
+            if looks_like_import(ref_line_text):
+                continue
+
+            # Skip the callee's own definition line
+            if isinstance(callee_def_line, int) and isinstance(line, int) and line == callee_def_line:
+                continue
+
+            # Optional: require call-like context (has '(' after token)
+            if not looks_like_call_context(ref_line_text, int(col) if isinstance(col, int) else None):
+                # If you prefer to keep non-call refs, comment this out
+                continue
+
+            # Map ref file to index key to locate caller symbols
+            ref_file_key = normalize_ref_file(ref_file, key_index)
+            if not ref_file_key:
+                continue
+            syms_in_ref_file = index.get(ref_file_key)
+            if not syms_in_ref_file or not syms_in_ref_file["symbols"]:
+                continue
+
+            pos, lines, chs = by_ref_file.setdefault(ref_file_key, ([], [], []))
+            pos.append(len(cands))
+            lines.append(int(line) if isinstance(line, int) else -1)
+            chs.append(int(col) if isinstance(col, int) else -1)
+            cands.append((callee_id, callee_name, callee_file_key, ref_file_key))
+
+    # Find callers: the innermost symbol in the ref file whose range encloses each ref position
+    callers: List[Optional[Symbol]] = [None] * len(cands)
+    for ref_file_key, (pos, lines, chs) in by_ref_file.items():
+        file_index = index[ref_file_key]
+        hits = find_enclosing_symbols(
+            file_index, np.array(lines, dtype=np.int64), np.array(chs, dtype=np.int64)
+        )
+        for k, h in zip(pos, hits.tolist()):
+            if h >= 0:
+                callers[k] = file_index["symbols"][h]
+
+    for (callee_id, callee_name, callee_file_key, ref_file_key), caller_sym in zip(cands, callers):
+        if caller_sym is None:
+            continue
+
+        caller_name = caller_sym.name if caller_sym.name is not None else "<unknown>"
+        # Heuristic: skip tiny alias-like symbols (often import alias or simple assignments)
+        sl, sc, el, ec = symbol_span(caller_sym)
+        if caller_name == callee_name and (el - sl == 0) and (ec - sc < 64):
+            # likely an import alias symbol; skip
+            continue
+
+        caller_id = sys.intern(f"{ref_file_key}:{caller_name}")
+        if caller_id != callee_id:
+            callee_file_for_edge = callee_file_key if isinstance(callee_file_key, str) else str(callee_file_key)
+            func_edges.setdefault((caller_id, callee_id), (ref_file_key, callee_file_for_edge))
+
+    return func_edges
+
+
+# Read-only lookup structures of a worker process, set once by init_worker
+_WORKER_INDEX: Dict[str, Dict[str, Any]] = {}
+_WORKER_KEY_INDEX: Dict[str, Any] = {}
+
+
+def init_worker(index: Dict[str, Dict[str, Any]], key_index: Dict[str, Any]) -> None:
+    """ProcessPoolExecutor initializer: receive the shared index once per worker."""
+    global _WORKER_INDEX, _WORKER_KEY_INDEX
+    _WORKER_INDEX, _WORKER_KEY_INDEX = index, key_index
+
+
+def collect_file_edges_in_worker(file_entry: FileEntry) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    return collect_file_edges(file_entry, _WORKER_INDEX, _WORKER_KEY_INDEX)
+
+
+def build_dependencies(data: PerFileDoc, workers: int = 1) -> Dict[str, Any]:
     """
     Create function-level edges A->B by inverting references:
       For each callee B (symbol), for each reference location r:
@@ -167,124 +438,81 @@ def build_dependencies(data: Dict[str, Any]) -> Dict[str, Any]:
         - find caller A whose range contains r.start in that file
         - produce A -> canonical(B)
     Also output file-level edges (fileA -> fileB) if any A->B exists across files.
+    With workers > 1, per-file edge collection is fanned out to a process pool; results are merged in file order.
     """
-    files = data.get("files", [])
+    files = data.files
     index = build_symbol_index(files)
-    index_keys = list(index.keys())
+    key_index = build_key_index(list(index.keys()))
 
-    func_edges: List[Dict[str, str]] = []
-    file_edges: Set[Tuple[str, str]] = set()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(index, key_index)) as ex:
+            per_file = list(ex.map(collect_file_edges_in_worker, files, chunksize=16))
+    else:
+        per_file = (collect_file_edges(fe, index, key_index) for fe in files)
 
-    for file_entry in files:
-        callee_file_rel = file_entry.get("file")
-        if not isinstance(callee_file_rel, str):
-            continue
+    # (src, dst) -> (src_file, dst_file); insertion-ordered, so first-seen edge order is kept
+    func_edges: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    for fe_func_edges in per_file:
+        for k, files_pair in fe_func_edges.items():
+            func_edges.setdefault(k, files_pair)
 
-        for sym in file_entry.get("symbols", []):
-            # Canonicalize callee to its definition file if available
-            canon_file, callee_name = canonicalize_callee(sym, callee_file_rel)
-            callee_file_key = normalize_ref_file(canon_file, index_keys) or canon_file
-            callee_id = f"{callee_file_key}:{callee_name}"
-
-            # Callee's own definition range (to ignore self-definition as ref)
-            callee_rng = sym.get("range") or {}
-            callee_def_line = (callee_rng.get("start") or {}).get("line")
-
-            for ref in sym.get("references", []) or []:
-                ref_file = ref.get("relativePath") or ref.get("absolutePath")
-                ref_rng = ref.get("range")
-                if not isinstance(ref_file, str) or not isinstance(ref_rng, dict):
-                    continue
-
-                # Skip import lines (not a call)
-                abs_path = ref.get("absolutePath")
-                start = ref_rng.get("start") or {}
-                line = start.get("line")
-                col = start.get("character")
-                ref_line_text = get_line_text(abs_path, int(line)) if isinstance(line, int) else None
-                if looks_like_import(ref_line_text):
-                    continue
-
-                # Skip the callee's own definition line
-                if isinstance(callee_def_line, int) and isinstance(line, int) and line == callee_def_line:
-                    continue
-
-                # Optional: require call-like context (has '(' after token)
-                if not looks_like_call_context(ref_line_text, int(col) if isinstance(col, int) else None):
-                    # If you prefer to keep non-call refs, comment this out
-                    continue
-
-                # Map ref file to index key to locate caller symbols
-                ref_file_key = normalize_ref_file(ref_file, index_keys)
-                if not ref_file_key:
-                    continue
-                syms_in_ref_file = index.get(ref_file_key)
-                if not syms_in_ref_file:
-                    continue
-
-                # Find caller: the innermost symbol in ref file whose range encloses the ref position
-                caller_sym = find_enclosing_symbol(
-                    syms_in_ref_file,
-                    int(line) if isinstance(line, int) else -1,
-                    int(col) if isinstance(col, int) else -1
-                )
-                if not caller_sym:
-                    continue
-
-                caller_name = caller_sym.get("name", "<unknown>")
-                # Heuristic: skip tiny alias-like symbols (often import alias or simple assignments)
-                sl, sc, el, ec = symbol_span(caller_sym)
-                if caller_name == callee_name and (el - sl == 0) and (ec - sc < 64):
-                    # likely an import alias symbol; skip
-                    continue
-
-                caller_id = f"{ref_file_key}:{caller_name}"
-                if caller_id != callee_id:
-                    func_edges.append({"src": caller_id, "dst": callee_id})
-                    # file-level
-                    caller_file = ref_file_key
-                    callee_file_for_edge = callee_file_key if isinstance(callee_file_key, str) else str(callee_file_key)
-                    if caller_file != callee_file_for_edge:
-                        file_edges.add((caller_file, callee_file_for_edge))
-
-    # Deduplicate edges
-    seen: Set[Tuple[str, str]] = set()
-    dedup_func_edges: List[Dict[str, str]] = []
-    for e in func_edges:
-        k = (e["src"], e["dst"])
-        if k not in seen:
-            seen.add(k)
-            dedup_func_edges.append(e)
+    # File-level edges follow from the deduplicated function edges that cross files
+    file_edges: Set[Tuple[str, str]] = {(s, d) for (s, d) in func_edges.values() if s != d}
 
     return {
-        "function_edges": dedup_func_edges,
+        "function_edges": [{"src": s, "dst": d} for (s, d) in func_edges],
         "file_edges": [{"src": s, "dst": d} for (s, d) in sorted(file_edges)]
     }
 
 
+def referenced_sources(data: PerFileDoc) -> List[str]:
+    """Sorted absolute paths of all reference files, i.e. the sources whose lines the call heuristics read."""
+    paths: Set[str] = set()
+    for fe in data.files:
+        for sym in fe.symbols:
+            for ref in sym.references or []:
+                if ref.absolutePath is not None:
+                    paths.add(ref.absolutePath)
+    return sorted(paths)
+
+
+def run_step(in_file: Path, output_dir: Path, output_name: str = "02_deps.json", workers: int = 1, use_cache: bool = True) -> Path:
+    """Build the dependency JSON into output_dir/output_name; shared by main() and pipeline.py. Returns the output path."""
+    in_file = Path(in_file).resolve()
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_file = output_dir / output_name
+
+    # Typed decode keeps only the fields this stage reads
+    data = load_per_file(in_file)
+
+    def run():
+        deps_json = build_dependencies(data, workers=workers)
+        out_file.write_bytes(orjson.dumps(deps_json, option=orjson.OPT_NON_STR_KEYS))
+
+    # Skip the stage if the input, this script and every source file whose lines the import/call
+    # heuristics read are unchanged since the last build of out_file. An edit such as `x = foo()` ->
+    # `x = foo` keeps all LSP positions, so the per-file JSON alone is not enough. Unreadable sources
+    # are keyed by path (get_line_text treats them as empty).
+    sources = [Path(src) for src in referenced_sources(data)]
+    readable = [src for src in sources if src.is_file()]
+    missing = "\n".join(str(src) for src in sources if not src.is_file())
+    cached(run, [in_file, Path(__file__), *readable], out_file, version=missing, enabled=use_cache)
+    return out_file
+
+
 def main():
     parser = argparse.ArgumentParser(description="Build dependency JSON from per-function JSON.")
     parser.add_argument("--input-file", required=True, help="Per-function JSON file.")
     parser.add_argument("--output-dir", help="Directory to store output JSON.")
     parser.add_argument("--output-name", default="02_deps.json", help="Output filename.")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for per-file work (default: 1, in-process).")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild even if the inputs are unchanged since the last run.")
     args = parser.parse_args()
 
-    in_file = Path(args.input_file).resolve()
-    if args.output_dir:
-        output_dir = Path(args.output_dir).resolve()
-    else:
-        output_dir = DEFAULT_OUT_ROOT.resolve()
-
-    output_dir.mkdir(parents=True, exist_ok=True)
-    out_file = output_dir / args.output_name
-
-    with in_file.open("r", encoding="utf-8") as f:
-        per_func_json = json.load(f)
-
-    deps_json = build_dependencies(per_func_json)
-    with out_file.open("w", encoding="utf-8") as f:
-        json.dump(deps_json, f, ensure_ascii=False, indent=2)
+    output_dir = Path(args.output_dir) if args.output_dir else DEFAULT_OUT_ROOT
+    run_step(Path(args.input_file), output_dir, args.output_name, workers=args.workers, use_cache=not args.no_cache)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,13 +1,30 @@
-import json
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Any, List, Tuple, Optional
 import argparse
+import io
+import os
+import re
+import subprocess
+import tokenize
 
+import orjson
 from multilspy import SyncLanguageServer
+from multilspy.lsp_protocol_handler.server import Error as LspError
 from multilspy.multilspy_config import MultilspyConfig
+from multilspy.multilspy_exceptions import MultilspyException
 from multilspy.multilspy_logger import MultilspyLogger
 
 DEFAULT_OUT_ROOT = Path("data/lsp_json_outputs")
+IDENTIFIER_RE = re.compile(r"[^\W\d]\w*")
+# Directories never scanned for sources (virtualenvs, VCS metadata, tool caches). Only names that
+# cannot be a project package; other virtualenvs are recognised by their pyvenv.cfg.
+SKIP_DIRS = {
+    ".git", ".hg", ".svn", "node_modules", "__pycache__", "venv", ".venv",
+    ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".ruff_cache", "site-packages",
+}
 
 
 def open_file_text(path: Path) -> str:
@@ -18,42 +35,199 @@ def open_file_text(path: Path) -> str:
         return path.read_text(encoding="utf-8", errors="ignore")
 
 
-def find_symbol_positions(src: str, name: str) -> List[Tuple[int, int]]:
+def find_py_files(repo_root: Path) -> List[Path]:
     """
-    A simple name locator: search each line for the first occurrence of 'name'.
-    Returns a list of (line, col) tuples.
+    List the .py files under repo_root, sorted, skipping SKIP_DIRS and hidden entries.
+    Uses ripgrep when available (parallel walk, honors .gitignore); otherwise falls back to
+    os.walk, pruning SKIP_DIRS and virtualenv roots (pyvenv.cfg) in place so they are never descended into.
+    """
+    cmd = ["rg", "--files", "-g", "*.py"]
+    for d in sorted(SKIP_DIRS):
+        cmd += ["-g", f"!{d}/"]
+    try:
+        out = subprocess.check_output(cmd, cwd=repo_root, text=True, stderr=subprocess.DEVNULL)
+        return sorted(repo_root / f for f in out.splitlines() if f)
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        # rg missing, or it exited non-zero (which it also does when nothing matches)
+        pass
+
+    # Hidden files and directories are skipped as well, as rg does by default
+    py_files: List[Path] = []
+    for dirpath, dirs, files in os.walk(repo_root):
+        if "pyvenv.cfg" in files and dirpath != str(repo_root):
+            # Root of a virtualenv, whatever its name
+            dirs[:] = []
+            continue
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        py_files.extend(Path(dirpath, f) for f in files if f.endswith(".py") and not f.startswith("."))
+    return sorted(py_files)
+
+
+def compute_line_starts(src: str) -> List[int]:
+    """Offsets where each line of src starts (same line breaks as str.splitlines)."""
+    starts = [0]
+    pos = 0
+    for line in src.splitlines(keepends=True):
+        pos += len(line)
+        starts.append(pos)
+    return starts
+
+
+def find_first_symbol_position(src: str, line_starts: List[int], name: str) -> Optional[Tuple[int, int]]:
+    """
+    A simple name locator: (line, col) of the first occurrence of 'name' in src, or None.
+    `line_starts` comes from compute_line_starts(src), computed once per file.
     Note: This is a lightweight demo, not a precise AST-based locator.
     """
-    hits = []
-    for i, line in enumerate(src.splitlines()):
-        col = line.find(name)
-        if col >= 0:
-            hits.append((i, col))
-    return hits
+    off = src.find(name)
+    if off < 0:
+        return None
+    line = bisect_right(line_starts, off) - 1
+    return line, off - line_starts[line]
+
+
+def selection_start(sym: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """(line, character) of a document symbol's selectionRange start, or None if the server did not send one."""
+    sel = sym.get("selectionRange")
+    start = sel.get("start") if isinstance(sel, dict) else None
+    if not isinstance(start, dict):
+        return None
+    line, col = start.get("line"), start.get("character")
+    if isinstance(line, int) and isinstance(col, int):
+        return line, col
+    return None
+
+
+def first_name_positions(src: str, line_starts: List[int]) -> Dict[str, Tuple[int, int]]:
+    """
+    Map every identifier in src to the (line, col) of its first occurrence, in one pass.
+    Uses tokenize, so names inside comments and strings are not matched; if the file does not
+    tokenize (e.g. a syntax error), falls back to a regex scan over the raw text.
+    `line_starts` comes from compute_line_starts(src), computed once per file.
+    """
+    first: Dict[str, Tuple[int, int]] = {}
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(src).readline):
+            if tok.type == tokenize.NAME and tok.string not in first:
+                first[tok.string] = (tok.start[0] - 1, tok.start[1])
+        return first
+    except (tokenize.TokenError, SyntaxError):
+        first.clear()
+
+    for m in IDENTIFIER_RE.finditer(src):
+        if m.group() not in first:
+            line = bisect_right(line_starts, m.start()) - 1
+            first[m.group()] = (line, m.start() - line_starts[line])
+    return first
 
 
 def flatten_symbols(symbols: Any) -> List[Dict[str, Any]]:
     """Flatten a possibly nested LSP symbol tree into a flat list of dicts."""
     flat: List[Dict[str, Any]] = []
-    stack: List[Any] = list(symbols or [])
+    # Pre-order walk; children go to the front in reverse so they come out in source order
+    stack: deque = deque(symbols or [])
     while stack:
-        node = stack.pop(0)
+        node = stack.popleft()
         if node is None:
             continue
         if isinstance(node, dict):
             flat.append(node)
             children = node.get("children") or []
             if isinstance(children, list) and children:
-                stack = list(children) + stack
+                stack.extendleft(reversed(children))
         elif isinstance(node, list):
             if node:
-                stack = list(node) + stack
+                stack.extendleft(reversed(node))
         else:
             continue
     return flat
 
 
-def lsp_scan_repo(repo_root: Path, code_language: str = "python") -> Dict[str, Any]:
+def query_symbol(lsp: SyncLanguageServer, rel_path: str, line: int, col: int) -> Tuple[List[Any], List[Any], Any]:
+    """
+    Run the references/definition/hover requests for one symbol position.
+    If the server rejects any of them, a warning is printed and the symbol gets empty results.
+    multilspy asserts on the response shape, so a `null` (allowed by the LSP spec) or unexpected
+    payload surfaces as AssertionError and is treated the same way.
+    Other exceptions (e.g. a crashed server) propagate instead of being silently swallowed.
+    """
+    try:
+        refs = lsp.request_references(rel_path, line, col) or []
+        defs = lsp.request_definition(rel_path, line, col) or []
+        hv = lsp.request_hover(rel_path, line, col)
+    except (MultilspyException, LspError, AssertionError) as e:
+        print(f"[WARN] LSP request failed on {rel_path}:{line}:{col}: {e!r}")
+        return [], [], None
+
+    return refs, defs, hv
+
+
+def collect_file_symbols(lsp: SyncLanguageServer, repo_root: Path, f: Path) -> Tuple[str, List[Tuple[Dict[str, Any], int, int]]]:
+    """
+    Request document symbols for one file and locate each symbol's name (selectionRange, else the text).
+    Returns (rel_path, [(sym_obj without references/definitions/hover yet, line, col)]).
+    """
+    rel_path = str(f.relative_to(repo_root))
+    # Empty files (e.g. bare __init__.py) have no symbols; keep the file entry but skip the RPCs
+    if f.stat().st_size == 0:
+        return rel_path, []
+
+    # Source text is only needed for symbols without a selectionRange; read it on first use
+    file_text: Optional[str] = None
+    line_starts: List[int] = []
+    first_positions: Dict[str, Tuple[int, int]] = {}
+
+    # Request document symbols for this file
+    try:
+        symbols_tree = lsp.request_document_symbols(rel_path)
+    except Exception as e:
+        print(f"[WARN] document_symbols failed on {rel_path}: {e}")
+        symbols_tree = []
+
+    flat_syms = flatten_symbols(symbols_tree)
+    # Query positions already taken in this file. Symbols are deduplicated by position, not by name:
+    # same-named symbols (e.g. __init__ of two classes) have their own selectionRange and are kept.
+    seen_positions: set[Tuple[int, int]] = set()
+    pending: List[Tuple[Dict[str, Any], int, int]] = []
+
+    for s in flat_syms:
+        name = s.get("name")
+        if not isinstance(name, str) or not name:
+            continue
+
+        # The server's selectionRange points at the symbol's own name; the text lookup is a fallback
+        position = selection_start(s)
+        if position is None:
+            if file_text is None:
+                file_text = open_file_text(f)
+                line_starts = compute_line_starts(file_text)
+                first_positions = first_name_positions(file_text, line_starts)
+            if name.isidentifier():
+                position = first_positions.get(name)
+            else:
+                # e.g. dotted names: not a single token, so search the raw text
+                position = find_first_symbol_position(file_text, line_starts, name)
+        if position is None or position in seen_positions:
+            continue
+        seen_positions.add(position)
+        line, col = position
+
+        sym_obj: Dict[str, Any] = {
+            "name": name,
+            "kind": s.get("kind"),
+            "range": s.get("range"),
+            "selectionRange": s.get("selectionRange"),
+            "detail": s.get("detail"),
+            "references": [],
+            "definitions": [],
+            "hover": None,
+        }
+        pending.append((sym_obj, line, col))
+
+    return rel_path, pending
+
+
+def lsp_scan_repo(repo_root: Path, code_language: str = "python", workers: int = 16) -> Dict[str, Any]:
     """
     Scan a project directory and emit compact JSON:
       {
@@ -64,80 +238,34 @@ def lsp_scan_repo(repo_root: Path, code_language: str = "python") -> Dict[str, A
           ]}
         ]
       }
+    Requests are blocking round-trips to the language server, so up to `workers` of them are kept
+    in flight from a thread pool; results keep file and symbol order.
     """
     logger = MultilspyLogger()
     config = MultilspyConfig.from_dict({"code_language": code_language})
     lsp = SyncLanguageServer.create(config, logger, str(repo_root))
 
     results: List[Dict[str, Any]] = []
-    py_files = list(repo_root.rglob("*.py"))
+    py_files = find_py_files(repo_root)
     if not py_files:
         print(f"[WARN] No .py files found under: {repo_root}")
 
-    with lsp.start_server():
-        for f in py_files:
-            rel_path = str(f.relative_to(repo_root))
-            file_text = open_file_text(f)
-
-            # Request document symbols for this file
-            try:
-                symbols_tree = lsp.request_document_symbols(rel_path)
-            except Exception as e:
-                print(f"[WARN] document_symbols failed on {rel_path}: {e}")
-                symbols_tree = []
-
-            flat_syms = flatten_symbols(symbols_tree)
-            seen_positions: set[Tuple[str, int, int, str]] = set()
+    with lsp.start_server(), ThreadPoolExecutor(max_workers=workers) as ex:
+        # Document symbols for all files, then references/definitions/hover for all symbols.
+        # Executor.map submits everything up front, so the server never idles between files.
+        per_file = list(ex.map(lambda f: collect_file_symbols(lsp, repo_root, f), py_files))
+        # Positions are unique per file (see collect_file_symbols), so each one is queried once
+        per_file_answers = [
+            ex.map(lambda p, rel_path=rel_path: query_symbol(lsp, rel_path, p[1], p[2]), pending)
+            for rel_path, pending in per_file
+        ]
+        for (rel_path, pending), answers in zip(per_file, per_file_answers):
             packed_symbols: List[Dict[str, Any]] = []
-
-            # For each symbol, collect references/definitions/hover and attach to the symbol object
-            for s in flat_syms:
-                name = s.get("name")
-                if not isinstance(name, str) or not name:
-                    continue
-
-                positions = find_symbol_positions(file_text, name)
-                if not positions:
-                    continue
-
-                line, col = positions[0]
-                key = (rel_path, line, col, name)
-                if key in seen_positions:
-                    continue
-                seen_positions.add(key)
-
-                sym_obj: Dict[str, Any] = {
-                    "name": name,
-                    "kind": s.get("kind"),
-                    "range": s.get("range"),
-                    "selectionRange": s.get("selectionRange"),
-                    "detail": s.get("detail"),
-                    "references": [],
-                    "definitions": [],
-                    "hover": None,
-                }
-
-                # References
-                try:
-                    refs = lsp.request_references(rel_path, line, col) or []
-                    sym_obj["references"] = refs
-                except Exception:
-                    pass
-
-                # Definitions
-                try:
-                    defs = lsp.request_definition(rel_path, line, col) or []
-                    sym_obj["definitions"] = defs
-                except Exception:
-                    pass
-
-                # Hover
-                try:
-                    hv = lsp.request_hover(rel_path, line, col)
-                    sym_obj["hover"] = hv
-                except Exception:
-                    pass
-
+            for (sym_obj, _, _), (refs, defs, hv) in zip(pending, answers):
+                # For each symbol, attach references/definitions/hover to the symbol object
+                sym_obj["references"] = refs
+                sym_obj["definitions"] = defs
+                sym_obj["hover"] = hv
                 packed_symbols.append(sym_obj)
 
             results.append({
@@ -152,25 +280,44 @@ def lsp_scan_repo(repo_root: Path, code_language: str = "python") -> Dict[str, A
     }
 
 
+def write_per_file(result: Dict[str, Any], out_file: Path) -> None:
+    """
+    Write the scan result. A '.ndjson' out_file gets one header line {"repo_root", "language"}
+    followed by one {"file", "symbols"} entry per line, so consumers can stream it file by file;
+    any other suffix gets the single (compact) JSON document.
+    """
+    if out_file.suffix != ".ndjson":
+        out_file.write_bytes(orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS))
+        return
+
+    with out_file.open("wb") as f:
+        f.write(orjson.dumps({"repo_root": result["repo_root"], "language": result["language"]}) + b"\n")
+        for file_entry in result["files"]:
+            f.write(orjson.dumps(file_entry, option=orjson.OPT_NON_STR_KEYS) + b"\n")
+
+
+def run_step(input_dir: Path, output_dir: Path, output_name: str = "00_per_file.ndjson", workers: int = 16) -> Path:
+    """Scan input_dir and write the per-file JSON to output_dir/output_name; shared by main() and pipeline.py."""
+    input_dir = Path(input_dir).resolve()
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_file = output_dir / output_name
+    result = lsp_scan_repo(input_dir, code_language="python", workers=workers)
+
+    write_per_file(result, out_file)
+    return out_file
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate per-file LSP JSON.")
     parser.add_argument("--input-dir", required=True, help="Directory to scan.")
     parser.add_argument("--output-dir", help="Directory to store output JSON.")
-    parser.add_argument("--output-name", default="00_per_file.json", help="Output filename.")
+    parser.add_argument("--output-name", default="00_per_file.ndjson", help="Output filename (.ndjson: one file entry per line).")
+    parser.add_argument("--workers", type=int, default=16, help="Concurrent language server requests (default: 16).")
     args = parser.parse_args()
 
-    input_dir = Path(args.input_dir).resolve()
-    if args.output_dir:
-        output_dir = Path(args.output_dir).resolve()
-    else:
-        output_dir = DEFAULT_OUT_ROOT.resolve()
-
-    output_dir.mkdir(parents=True, exist_ok=True)
-    out_file = output_dir / args.output_name
-    result = lsp_scan_repo(input_dir, code_language="python")
-
-    with out_file.open("w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    output_dir = Path(args.output_dir) if args.output_dir else DEFAULT_OUT_ROOT
+    run_step(Path(args.input_dir), output_dir, args.output_name, workers=args.workers)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,27 +1,69 @@
-import json
+import os
+import sys
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
-from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional
+from collections import Counter
 import argparse
 
+import ijson
+import orjson
+
+from cache import cached
+
 
 DEFAULT_OUT_ROOT = Path("data/lsp_json_outputs")
 PROJECT_ROOT_TOKEN = "PROJECT"
 
+
+class SymbolEntries:
+    """
+    Re-iterable stream over the "symbols" array of a per-function JSON.
+    Each iteration re-reads the file with ijson, so only one symbol is materialized at a time.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with self.path.open("rb") as f:
+            yield from ijson.items(f, "symbols.item", use_float=True)
+
+
+@lru_cache(maxsize=None)
+def resolve_path(p: str) -> str:
+    """Cached os.path.realpath (same result as str(Path(p).resolve()))."""
+    return os.path.realpath(p)
+
+
+@lru_cache(maxsize=None)
+def is_project_root(d: str) -> bool:
+    """True if directory d contains both 'data' and 'src'."""
+    return os.path.exists(os.path.join(d, "data")) and os.path.exists(os.path.join(d, "src"))
+
+
+def intern_str(v: Any) -> Any:
+    """sys.intern for strings; other values are returned unchanged."""
+    return sys.intern(v) if isinstance(v, str) else v
+
+
+@lru_cache(maxsize=None)
 def normalize_path(abs_path: str, repo_root: Path) -> str:
     """
     Replace repo_root with PROJECT_ROOT_TOKEN in absolute paths.
     If the path is outside the repo (third-party), keep the original absolute path.
+    Results are interned, so every symbol's references share one string per file.
+    LSP paths are already absolute, so they are only normalized lexically (no filesystem access);
+    relative paths are still resolved against the CWD.
     """
-    try:
-        abs_p = Path(abs_path).resolve()
-        if repo_root in abs_p.parents or abs_p == repo_root:
-            rel = abs_p.relative_to(repo_root)
-            return f"{PROJECT_ROOT_TOKEN}/{rel.as_posix()}"
-        else:
-            return abs_path  # external path
-    except Exception:
-        return abs_path
+    rp = os.path.normpath(abs_path) if os.path.isabs(abs_path) else resolve_path(abs_path)
+    root = str(repo_root)
+    if rp == root:
+        return f"{PROJECT_ROOT_TOKEN}/."
+    root_prefix = root if root.endswith("/") else root + "/"
+    if rp.startswith(root_prefix):
+        return sys.intern(f"{PROJECT_ROOT_TOKEN}/{rp[len(root_prefix):]}")
+    return sys.intern(abs_path)  # external path
 
 
 def prune_references(refs: List[Dict[str, Any]], repo_root: Path) -> List[Dict[str, Any]]:
@@ -29,38 +71,39 @@ def prune_references(refs: List[Dict[str, Any]], repo_root: Path) -> List[Dict[s
     Keep only absolutePath and normalize it.
     Then count how many times each path appears.
     """
-    counter: Dict[str, int] = defaultdict(int)
-    for r in refs:
-        abs_path = r.get("absolutePath")
-        if isinstance(abs_path, str):
-            norm = normalize_path(abs_path, repo_root)
-            counter[norm] += 1
+    # Counter(iterable) counts in C (_count_elements)
+    counter = Counter(
+        normalize_path(r["absolutePath"], repo_root)
+        for r in refs
+        if isinstance(r.get("absolutePath"), str)
+    )
 
-    pruned = [{"absolutePath": path, "count": count} for path, count in counter.items()]
-    return sorted(pruned, key=lambda x: x["absolutePath"])
+    return [{"absolutePath": path, "count": count} for path, count in sorted(counter.items())]
 
 
 def prune_definitions(defs: List[Dict[str, Any]], repo_root: Path) -> List[Dict[str, Any]]:
     """Keep only absolutePath and normalize it."""
-    seen = set()
-    pruned = []
-    for d in defs:
-        abs_path = d.get("absolutePath")
-        if isinstance(abs_path, str):
-            norm = normalize_path(abs_path, repo_root)
-            if norm not in seen:
-                seen.add(norm)
-                pruned.append({"absolutePath": norm})
-    return pruned
+    # dict.fromkeys dedups while keeping first-seen order
+    norms = dict.fromkeys(
+        normalize_path(d["absolutePath"], repo_root)
+        for d in defs
+        if isinstance(d.get("absolutePath"), str)
+    )
+    return [{"absolutePath": norm} for norm in norms]
 
 
 def prune_hover(hv_list: Any) -> Any:
-    """Remove 'range' from hover info."""
+    """Remove 'range' from hover info; a list also drops repeated items (first-seen order), in the same pass."""
     if isinstance(hv_list, list):
         pruned = []
+        seen = set()
         for hv in hv_list:
             if isinstance(hv, dict):
                 hv.pop("range", None)
+            k = orjson.dumps(hv, option=orjson.OPT_SORT_KEYS)
+            if k in seen:
+                continue
+            seen.add(k)
             pruned.append(hv)
         return pruned
     elif isinstance(hv_list, dict):
@@ -75,93 +118,107 @@ def detect_repo_root(data: Dict[str, Any]) -> Path:
     Detect the absolute project root by finding the deepest common directory
     that still contains all internal source files.
     """
-    abs_paths = []
-
-    # Collect all absolute paths from references and definitions
+    # Collect all absolute paths from references and definitions; dedupe the raw strings
+    # (first-seen order) before resolving, since the same few paths repeat for every symbol
+    raw: Dict[str, None] = {}
     for sym in data.get("symbols", []):
         for ref in sym.get("references", []):
             if "absolutePath" in ref:
-                abs_paths.append(Path(ref["absolutePath"]).resolve())
+                raw[ref["absolutePath"]] = None
         for d in sym.get("definitions", []):
             if "absolutePath" in d:
-                abs_paths.append(Path(d["absolutePath"]).resolve())
+                raw[d["absolutePath"]] = None
+    unique: Dict[str, None] = dict.fromkeys(os.path.realpath(p) for p in raw)
 
     # Fallback if none found
-    if not abs_paths:
+    if not unique:
         print("[WARN] No absolutePath found; using current directory as project root.")
         return Path.cwd().resolve()
 
-    # Step 1: take common path among all absolute paths
-    common_path = Path(abs_paths[0])
-    for p in abs_paths[1:]:
-        common_path = Path(*[a for a, b in zip(common_path.parts, p.parts) if a == b])
-        if common_path == Path("/"):
-            # stop early if we reach filesystem root
-            break
-
-    # Step 2: if result is too shallow (e.g. "/"), try to locate 'data/test_project' automatically
-    # this ensures absolute project root for your case
+    # Step 1: locate 'data/test_project' automatically; the common path below is often too
+    # shallow (e.g. "/" once stdlib paths are mixed in). Each path is walked up on its own, since
+    # the project root is usually below the common path of all paths.
     possible_root = None
-    for p in abs_paths:
-        parts = p.parts
-        for i in range(len(parts), 0, -1):
-            sub = Path(*parts[:i])
-            if (sub / "data").exists() and (sub / "src").exists():
-                possible_root = sub
+    for p in unique:
+        # Walk p and its ancestors, deepest first; checks are cached per directory
+        sub = p
+        while True:
+            if is_project_root(sub):
+                possible_root = Path(sub)
                 break
+            parent = os.path.dirname(sub)
+            if parent == sub:
+                break
+            sub = parent
         if possible_root:
             break
 
-    repo_root = possible_root if possible_root else common_path
-    return repo_root.resolve()
+    if possible_root:
+        return possible_root.resolve()
 
+    # Step 2: fall back to the common path among all absolute paths
+    return Path(os.path.commonpath(list(unique))).resolve()
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Prune LSP symbol JSON.")
-    parser.add_argument("--input-file", required=True, help="Path to the symbol JSON to prune.")
-    parser.add_argument("--output-dir", help="Directory to store pruned JSON. Default is data/lsp_json_outputs.")
-    parser.add_argument("--output-name", default="03_pruned.json", help="Output filename.")
-    parser.add_argument("--repo-root", help="(Optional) Explicit project root; if not set, auto-detect.")
-
-    args = parser.parse_args()
-
-    in_path = Path(args.input_file).resolve()
-
-    if args.output_dir:
-        out_dir = Path(args.output_dir).resolve()
-    else:
-        out_dir = DEFAULT_OUT_ROOT.resolve()
 
+def run_step(in_path: Path, out_dir: Path, output_name: str = "03_pruned.json", repo_root: Optional[Path] = None, use_cache: bool = True) -> Path:
+    """
+    Prune a per-function JSON into out_dir/output_name; shared by main() and pipeline.py.
+    If repo_root is None it is auto-detected from the symbols. Returns the output path.
+    """
+    in_path = Path(in_path).resolve()
+    out_dir = Path(out_dir).resolve()
     out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / args.output_name
+    out_path = out_dir / output_name
 
-    data = json.loads(in_path.read_text(encoding="utf-8"))
+    # Stream symbols instead of loading the whole document (read again if the root is auto-detected)
+    data = {"symbols": SymbolEntries(in_path)}
 
-    if args.repo_root:
-        repo_root = Path(args.repo_root).resolve()
+    if repo_root:
+        repo_root = Path(repo_root).resolve()
         print(f"[INFO] Using provided repo root: {repo_root}")
     else:
         repo_root = detect_repo_root(data)
         print(f"[INFO] Detected project root: {repo_root}")
 
-    symbols_out = []
-    for sym in data.get("symbols", []):
-        new_sym = {
-            "file": sym.get("file"),
-            "name": sym.get("name"),
-            "kind": sym.get("kind"),
-            "range": sym.get("range"), 
-            "references": prune_references(sym.get("references", []), repo_root),
-            "definitions": prune_definitions(sym.get("definitions", []), repo_root),
-            "hover": prune_hover(sym.get("hover")),
-        }
-        symbols_out.append(new_sym)
-
-    result = {"repoRoot": str(repo_root), "symbols": symbols_out}
-    out_path.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
-
-    print(f"[INFO] Wrote pruned symbol JSON → {out_path}")
+    def run():
+        symbols_out = []
+        for sym in data.get("symbols", []):
+            new_sym = {
+                "file": intern_str(sym.get("file")),
+                "name": intern_str(sym.get("name")),
+                "kind": sym.get("kind"),
+                "range": sym.get("range"), 
+                "references": prune_references(sym.get("references", []), repo_root),
+                "definitions": prune_definitions(sym.get("definitions", []), repo_root),
+                "hover": prune_hover(sym.get("hover")),
+            }
+            symbols_out.append(new_sym)
+
+        result = {"repoRoot": str(repo_root), "symbols": symbols_out}
+        out_path.write_bytes(orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS))
+
+        print(f"[INFO] Wrote pruned symbol JSON → {out_path}")
+
+    # Skip the stage if input, this script and the repo root are unchanged since the last build of out_path.
+    # CWD is part of the key because normalize_path resolves relative paths against it.
+    cached(run, [in_path, Path(__file__)], out_path, version=f"{repo_root}\0{Path.cwd()}", enabled=use_cache)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune LSP symbol JSON.")
+    parser.add_argument("--input-file", required=True, help="Path to the symbol JSON to prune.")
+    parser.add_argument("--output-dir", help="Directory to store pruned JSON. Default is data/lsp_json_outputs.")
+    parser.add_argument("--output-name", default="03_pruned.json", help="Output filename.")
+    parser.add_argument("--repo-root", help="(Optional) Explicit project root; if not set, auto-detect.")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild even if the inputs are unchanged since the last run.")
+
+    args = parser.parse_args()
+
+    out_dir = Path(args.output_dir) if args.output_dir else DEFAULT_OUT_ROOT
+    repo_root = Path(args.repo_root) if args.repo_root else None
+    run_step(Path(args.input_file), out_dir, args.output_name, repo_root=repo_root, use_cache=not args.no_cache)
 
 
 if __name__ == "__main__":
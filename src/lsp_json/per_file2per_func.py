@@ -1,8 +1,12 @@
-import json
 from pathlib import Path
-from typing import Dict, Any, List, Tuple, DefaultDict
-from collections import defaultdict
+from typing import Dict, Any, Iterator, List, Set, Tuple
 import argparse
+import sys
+
+import ijson
+import orjson
+
+from cache import cached
 
 
 DEFAULT_OUT_ROOT = Path("data/lsp_json_outputs")
@@ -15,97 +19,154 @@ LSP_SYMBOL_KINDS = {
     26: "TypeParameter"
 }
 
-def merge_symbols_by_file_and_name(data: Dict[str, Any]) -> Dict[str, Any]:
+
+class FileEntries:
     """
-    Merge all symbols across files by their *definition file* and name.
-    The output 'file' field will always be the file where the symbol is defined.
-    For range/selectionRange, we keep the ones from the defining occurrence.
+    Re-iterable stream over the file entries of a per-file JSON.
+    '.ndjson' input is read line by line (header line first, then one entry per line); a single
+    JSON document is streamed with ijson. Either way only one file entry is materialized at a time.
     """
-    # Collect raw occurrences
-    raw: List[Tuple[str, Dict[str, Any]]] = []  # (file_name_in_this_doc, symbol_dict)
-    for file_entry in data.get("files", []):
-        file_name = file_entry.get("file")
-        for sym in file_entry.get("symbols", []):
-            raw.append((file_name, sym))
-
-    # Helper: pick candidate definition file from one occurrence
-    def candidate_def_file(sym: Dict[str, Any], fallback_file: str) -> str:
-        defs = sym.get("definitions") or []
-        if defs and isinstance(defs, list) and isinstance(defs[0], dict):
-            # Prefer relativePath if available; else absolutePath; else fallback
-            rel = defs[0].get("relativePath")
-            if isinstance(rel, str) and rel:
-                return rel
-            ap = defs[0].get("absolutePath")
-            if isinstance(ap, str) and ap:
-                return ap
-        return fallback_file
-
-    # First pass: determine canonical (def_file, name) for grouping
-    groups: DefaultDict[Tuple[str, str], List[Tuple[str, Dict[str, Any]]]] = defaultdict(list)
-    for file_name, sym in raw:
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with self.path.open("rb") as f:
+            if self.path.suffix == ".ndjson":
+                next(f, None)  # header: repo_root / language
+                for line in f:
+                    if line.strip():
+                        yield orjson.loads(line)
+            else:
+                yield from ijson.items(f, "files.item", use_float=True)
+
+
+def candidate_def_file(sym: Dict[str, Any], fallback_file: str) -> str:
+    """Pick candidate definition file from one occurrence."""
+    defs = sym.get("definitions") or []
+    if defs and isinstance(defs, list) and isinstance(defs[0], dict):
+        # Prefer relativePath if available; else absolutePath; else fallback
+        rel = defs[0].get("relativePath")
+        if isinstance(rel, str) and rel:
+            return rel
+        ap = defs[0].get("absolutePath")
+        if isinstance(ap, str) and ap:
+            return ap
+    return fallback_file
+
+
+def intern_location_paths(locs: List[Any]) -> List[Any]:
+    """Intern the path strings of LSP locations in place; the same few files recur across all references."""
+    for loc in locs:
+        if isinstance(loc, dict):
+            for k in ("absolutePath", "relativePath"):
+                v = loc.get(k)
+                if isinstance(v, str):
+                    loc[k] = sys.intern(v)
+    return locs
+
+
+def group_file_entry(file_entry: Dict[str, Any]) -> List[Tuple[Tuple[str, str], str, Dict[str, Any]]]:
+    """
+    Determine the canonical (def_file, name) key of every symbol in one file entry.
+    Returns [(key, file_name_in_this_doc, symbol_dict)] in symbol order.
+    """
+    file_name = file_entry.get("file")
+    keyed = []
+    for sym in file_entry.get("symbols", []):
         name = sym.get("name")
         if not isinstance(name, str):
             continue
-        def_file = candidate_def_file(sym, file_name)
-        groups[(def_file, name)].append((file_name, sym))
-
-    merged_result: List[Dict[str, Any]] = []
+        keyed.append(((candidate_def_file(sym, file_name), name), file_name, sym))
+    return keyed
 
-    # Second pass: merge each group; set file to canonical def file
-    for (def_file, name), occs in groups.items():
-        all_refs: List[Dict[str, Any]] = []
-        all_defs: List[Dict[str, Any]] = []
-        all_hover: List[Any] = []
 
-        # Prefer range/selectionRange from the occurrence that lives in the definition file
-        def_range = None
-        def_sel_range = None
-        def_kind = None
+def merge_symbols_by_file_and_name(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Merge all symbols across files by their *definition file* and name.
+    The output 'file' field will always be the file where the symbol is defined.
+    For range/selectionRange, we keep the ones from the defining occurrence.
+    """
+    files = data.get("files", [])
+
+    # Single pass: fold every occurrence straight into the merged entry of its (def_file, name)
+    merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    def_kinds: Dict[Tuple[str, str], Any] = {}
+    # Canonical (sorted-key JSON) forms of the definitions already in each entry
+    seen_defs: Dict[Tuple[str, str], Set[bytes]] = {}
+    # map() is lazy: with a streamed FileEntries input only one file entry is read at a time,
+    # and the fold holds only the merged entries, not every keyed occurrence
+    for keyed in map(group_file_entry, files):
+        for key, file_name, sym in keyed:
+            def_file, name = key
+            entry = merged.get(key)
+            if entry is None:
+                # One shared copy of each file path / name across all entries
+                def_file, name = sys.intern(def_file), sys.intern(name)
+                entry = merged[key] = {
+                    "file": def_file,         # always the definition file
+                    "name": name,
+                    "kind": "Unknown",
+                    "range": None,            # may stay None if not present
+                    "selectionRange": None,   # may stay None if not present
+                    "references": [],
+                    "definitions": [],
+                    "hover": None,
+                }
+                seen_defs[key] = set()
 
-        for file_name, sym in occs:
             # accumulate references/definitions
-            refs = sym.get("references") or []
-            defs = sym.get("definitions") or []
-            all_refs.extend(refs)
-            all_defs.extend(defs)
-
-            final_hover = None
-
-            # capture range from defining occurrence
-            if def_range is None and file_name == def_file:
+            entry["references"].extend(intern_location_paths(sym.get("references") or []))
+            # Every occurrence reports the same definition; keep each distinct one once, first-seen order
+            defs_seen = seen_defs[key]
+            for d in intern_location_paths(sym.get("definitions") or []):
+                d_key = orjson.dumps(d, option=orjson.OPT_SORT_KEYS)
+                if d_key not in defs_seen:
+                    defs_seen.add(d_key)
+                    entry["definitions"].append(d)
+
+            # Prefer range/selectionRange from the occurrence that lives in the definition file
+            if entry["range"] is None and file_name == def_file:
                 if "range" in sym:
-                    def_range = sym.get("range")
+                    entry["range"] = sym.get("range")
                 if "selectionRange" in sym:
-                    def_sel_range = sym.get("selectionRange")
-                if def_kind is None and "kind" in sym: 
-                    def_kind = sym.get("kind")
-
-            if final_hover is None:
-                hv = sym.get("hover")
-                if hv and isinstance(hv, dict) and "contents" in hv:
-                    final_hover = hv["contents"]
-                elif hv: 
-                    final_hover = hv
-                    
-
-        kind_str = LSP_SYMBOL_KINDS.get(def_kind, "Unknown") if def_kind is not None else "Unknown"
-
-        merged_result.append({
-            "file": def_file,                 # always the definition file
-            "name": name,
-            "kind": kind_str,
-            "range": def_range,               # may be None if not present
-            "selectionRange": def_sel_range,  # may be None if not present
-            "references": all_refs,
-            "definitions": all_defs,
-            "hover": final_hover
-        })
+                    entry["selectionRange"] = sym.get("selectionRange")
+                if def_kinds.get(key) is None and "kind" in sym:
+                    def_kinds[key] = sym.get("kind")
+
+            # Hover comes from the last occurrence
+            hv = sym.get("hover")
+            if hv and isinstance(hv, dict) and "contents" in hv:
+                entry["hover"] = hv["contents"]
+            else:
+                entry["hover"] = hv or None
+
+    merged_result: List[Dict[str, Any]] = list(merged.values())
+    for key, entry in merged.items():
+        def_kind = def_kinds.get(key)
+        entry["kind"] = LSP_SYMBOL_KINDS.get(def_kind, "Unknown") if def_kind is not None else "Unknown"
 
     return {"symbols": merged_result}
 
 
 
+def run_step(in_file: Path, output_dir: Path, output_name: str = "01_per_func.json", use_cache: bool = True) -> Path:
+    """Merge a per-file JSON into output_dir/output_name; shared by main() and pipeline.py. Returns the output path."""
+    in_file = Path(in_file).resolve()
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    out_file = output_dir / output_name
+
+    def run():
+        # Stream file entries instead of loading the whole document
+        per_func_json = merge_symbols_by_file_and_name({"files": FileEntries(in_file)})
+        out_file.write_bytes(orjson.dumps(per_func_json, option=orjson.OPT_NON_STR_KEYS))
+
+    # Skip the stage if the input and this script are unchanged since the last build of out_file
+    cached(run, [in_file, Path(__file__)], out_file, enabled=use_cache)
+    return out_file
+
+
 def main():
     """Main entry: read the original LSP JSON, merge symbols, and save grouped output."""
     
@@ -113,23 +174,11 @@ def main():
     parser.add_argument("--input-file", required=True, help="Per-file JSON produced by lsp_per_file.py.")
     parser.add_argument("--output-dir", help="Directory to store output JSON.")
     parser.add_argument("--output-name", default="01_per_func.json", help="Output filename.")
+    parser.add_argument("--no-cache", action="store_true", help="Rebuild even if the inputs are unchanged since the last run.")
     args = parser.parse_args()
 
-    in_file = Path(args.input_file).resolve()
-    if args.output_dir:
-        output_dir = Path(args.output_dir).resolve()
-    else:
-        output_dir = DEFAULT_OUT_ROOT.resolve()
-    output_dir.mkdir(parents=True, exist_ok=True)
-    out_file = output_dir / args.output_name
-
-    with in_file.open("r", encoding="utf-8") as f:
-        per_file_json = json.load(f)
-
-    per_func_json = merge_symbols_by_file_and_name(per_file_json)
-
-    with out_file.open("w", encoding="utf-8") as f:
-        json.dump(per_func_json, f, ensure_ascii=False, indent=2)
+    output_dir = Path(args.output_dir) if args.output_dir else DEFAULT_OUT_ROOT
+    run_step(Path(args.input_file), output_dir, args.output_name, use_cache=not args.no_cache)
 
 if __name__ == "__main__":
     main()
@@ -3,6 +3,16 @@ import subprocess
 import sys
 from pathlib import Path
 
+# The lsp_json stages are standalone scripts with sibling imports (e.g. `from cache import cached`);
+# put their directory on sys.path so they can also be imported and run in this process.
+sys.path.insert(0, str(Path(__file__).resolve().parent / "lsp_json"))
+
+import integrate
+import lsp_build_deps
+import lsp_per_file
+import lsp_prune
+import per_file2per_func
+
 PYTHON = sys.executable  # use current python interpreter
 DEFAULT_OUT_ROOT = Path("data/lsp_json_outputs")
 SHOW_ABS_PATH = False
@@ -55,53 +65,34 @@ def main():
 
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    per_file_json = output_dir / "00_per_file.json"
+    per_file_json = output_dir / "00_per_file.ndjson"  # one file entry per line, streamed by steps 2-3
     per_func_json = output_dir / "01_per_func.json"
     deps_json = output_dir / "02_deps.json"
     pruned_json = output_dir / "03_pruned.json"
     final_json = output_dir / "04_final_integrated.json"
 
+    # Steps 1-5 run in this process: no interpreter start-up or re-import of orjson/numpy/msgspec per step.
+    # Each step still writes its JSON, which is the next step's input and the cache key.
+
     # 1. per-file
-    run([
-        PYTHON, "src/lsp_json/lsp_per_file.py",
-        "--input-dir", str(input_dir),
-        "--output-dir", str(output_dir),
-        "--output-name", per_file_json.name,
-    ])
+    print("[RUN] lsp_per_file")
+    lsp_per_file.run_step(input_dir, output_dir, per_file_json.name)
 
     # 2. per-file -> per-func
-    run([
-        PYTHON, "src/lsp_json/per_file2per_func.py",
-        "--input-file", str(per_file_json),
-        "--output-dir", str(output_dir),
-        "--output-name", per_func_json.name,
-    ])
+    print("[RUN] per_file2per_func")
+    per_file2per_func.run_step(per_file_json, output_dir, per_func_json.name)
 
     # 3. deps
-    run([
-        PYTHON, "src/lsp_json/lsp_build_deps.py",
-        "--input-file", str(per_file_json),
-        "--output-dir", str(output_dir),
-        "--output-name", deps_json.name,
-    ])
+    print("[RUN] lsp_build_deps")
+    lsp_build_deps.run_step(per_file_json, output_dir, deps_json.name)
 
     # 4. prune
-    run([
-        PYTHON, "src/lsp_json/lsp_prune.py",
-        "--input-file", str(per_func_json),
-        "--output-dir", str(output_dir),
-        "--output-name", pruned_json.name,
-        "--repo-root", str(input_dir),   # Pass default repo root from pipeline
-    ])
+    print("[RUN] lsp_prune")
+    lsp_prune.run_step(per_func_json, output_dir, pruned_json.name, repo_root=input_dir)  # Pass default repo root from pipeline
 
     # 5. integrate
-    run([
-        PYTHON, "src/lsp_json/integrate.py",
-        "--input-file", str(pruned_json),
-        "--deps-file", str(deps_json),     
-        "--output-dir", str(output_dir),
-        "--output-name", final_json.name,
-    ])
+    print("[RUN] integrate")
+    integrate.run_step(pruned_json, deps_json, output_dir, final_json.name)
 
     # 6. topo sort (produce build/run order of project symbols)
     sorted_json = output_dir / "05_sorted_topo.json"